@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Dominant-colour engine benchmark for V-EYE
+================================================
+
+Times every ColorDetector engine on a folder of frames (or synthetic test
+images) and compares each palette with the reference engine's (sklearn KMeans
+by default).
+
+Usage:
+    python benchmark_color.py --images samples/
+    python benchmark_color.py --reference fast_kmeans --repeat 5
+
+Agreement columns:
+    rgb_dist     mean RGB distance between matched palette colours
+    pct_diff     mean |percentage difference| of matched colours
+    primary      fraction of images whose primary colour name matches
+    names        fraction of palette names shared with the reference
+"""
+
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from colour_detection import ColorDetector
+from frame import Frame
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_frames(folder):
+    frames = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            bgr = cv2.imread(os.path.join(folder, name))
+            if bgr is not None:
+                frames.append(Frame(bgr=bgr))
+    return frames
+
+
+def synthetic_frames(n=20, seed=0):
+    """Blocks of a few flat colours plus noise, roughly like clothing close-ups."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n):
+        img = np.empty((480, 640, 3), dtype=np.float32)
+        img[:] = rng.integers(0, 256, 3)
+        for _ in range(rng.integers(1, 4)):
+            x, y = rng.integers(0, 480), rng.integers(0, 320)
+            img[y:y + rng.integers(80, 240), x:x + rng.integers(80, 320)] = rng.integers(0, 256, 3)
+        img += rng.normal(0, 8, img.shape)
+        frames.append(Frame(bgr=np.clip(img, 0, 255).astype(np.uint8)))
+    return frames
+
+
+def compare(reference, candidate):
+    ref, cand = reference["dominant_colors"], candidate["dominant_colors"]
+    ref_rgb = np.array([c["rgb"] for c in ref], dtype=np.float64)
+    cand_rgb = np.array([c["rgb"] for c in cand], dtype=np.float64)
+    dist = np.linalg.norm(ref_rgb[:, None] - cand_rgb[None], axis=2)
+
+    # greedy one-to-one matching by RGB distance
+    dists, pct = [], []
+    while np.isfinite(dist).any():
+        i, j = np.unravel_index(np.argmin(dist), dist.shape)
+        dists.append(dist[i, j])
+        pct.append(abs(ref[i]["percentage"] - cand[j]["percentage"]))
+        dist[i, :] = np.inf
+        dist[:, j] = np.inf
+
+    ref_names, cand_names = {c["name"] for c in ref}, {c["name"] for c in cand}
+    return {
+        "rgb_dist": float(np.mean(dists)),
+        "pct_diff": float(np.mean(pct)),
+        "primary": float(reference["primary_color"]["name"] == candidate["primary_color"]["name"]),
+        "names": len(ref_names & cand_names) / len(ref_names),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ColorDetector dominant-colour engines")
+    parser.add_argument("--images", help="folder of frames (default: synthetic images)")
+    parser.add_argument("--reference", default="kmeans", choices=ColorDetector.ENGINES)
+    parser.add_argument("--n-colors", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = load_frames(args.images) if args.images else synthetic_frames()
+    for frame in frames:
+        frame.thumbnail(300)  # exclude the shared resize from engine timings
+
+    detector = ColorDetector()
+    results, report = {}, {}
+    for engine in ColorDetector.ENGINES:
+        try:
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                results[engine] = [detector.detect_color(f, n_colors=args.n_colors, engine=engine) for f in frames]
+            elapsed = (time.perf_counter() - started) / (args.repeat * len(frames)) * 1000
+        except ImportError as e:
+            print(f"[skip] {engine}: {e}")
+            continue
+        report[engine] = {"ms_per_image": round(elapsed, 2)}
+
+    if args.reference not in results:
+        print(f"Reference engine {args.reference!r} unavailable; timings only")
+    else:
+        for engine in results:
+            scores = [compare(r, c) for r, c in zip(results[args.reference], results[engine])]
+            report[engine].update({k: round(float(np.mean([s[k] for s in scores])), 3) for k in scores[0]})
+
+    print(f"{len(frames)} images, reference={args.reference}")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,284 @@
-from PIL import Image
+import hashlib
+import json
+import os
+import tempfile
+
+import cv2
 import numpy as np
-import io
-from sklearn.cluster import KMeans
 import webcolors
 
+from frame import Frame
+
+# Dominant-colour engine for detect_color (overridable per request):
+#   "kmeans"      - sklearn KMeans, n_init=10 on every pixel (reference)
+#   "fast_kmeans" - Lloyd iterations from a fixed k-means++ init on a subsample
+#   "histogram"   - peaks of a 16x16x16 colour histogram
+#   "median_cut"  - median-cut boxes
+# The default changed from "kmeans" to "fast_kmeans"; palettes can differ
+# slightly from earlier releases, COLOR_ENGINE=kmeans restores them.
+COLOR_ENGINE = os.environ.get("COLOR_ENGINE", "fast_kmeans").lower()
+
+_SUBSAMPLE = 10000   # pixels fed to fast_kmeans
+_BOX_COLOR_DIM = int(os.environ.get("BOX_COLOR_DIM", "320"))  # shared view for per-box colours
+_HIST_BITS = 4       # histogram bins per channel = 2**_HIST_BITS
+
+
+def _assign(pixels, centers):
+    """Nearest-center label per pixel."""
+    d = (pixels[:, None, :] - centers.astype(np.float32)[None, :, :]) ** 2
+    return d.sum(axis=2).argmin(axis=1)
+
+
+def _kmeans_sklearn(pixels, k):
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    kmeans.fit(pixels)
+    return kmeans.cluster_centers_, kmeans.labels_
+
+
+def _kmeans_fast(pixels, k, iters=20, seed=42):
+    px = pixels.astype(np.float32)
+    rng = np.random.default_rng(seed)
+    sample = px[rng.choice(len(px), _SUBSAMPLE, replace=False)] if len(px) > _SUBSAMPLE else px
+
+    # k-means++ init with a fixed seed: deterministic, one pass
+    centers = [sample[rng.integers(len(sample))]]
+    for _ in range(1, k):
+        d = np.min(((sample[:, None, :] - np.array(centers)[None]) ** 2).sum(axis=2), axis=1)
+        if d.sum() == 0:
+            # fewer distinct colours than k (e.g. a uniform image): no duplicate centers
+            break
+        centers.append(sample[rng.choice(len(sample), p=d / d.sum())])
+    centers = np.array(centers)
+    k = len(centers)
+
+    for _ in range(iters):
+        labels = _assign(sample, centers)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=k)[:, None]
+        moved = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+        if np.abs(moved - centers).max() < 0.5:
+            centers = moved
+            break
+        centers = moved
+    return centers, _assign(px, centers)
+
+
+def _histogram_peaks(pixels, k):
+    shift = 8 - _HIST_BITS
+    bins = 1 << _HIST_BITS
+    q = (pixels >> shift).astype(np.int64)
+    idx = (q[:, 0] * bins + q[:, 1]) * bins + q[:, 2]
+    counts = np.bincount(idx, minlength=bins ** 3)
+
+    # mean colour of every occupied bin
+    means = np.stack([np.bincount(idx, weights=pixels[:, c], minlength=bins ** 3) for c in range(3)], axis=1)
+    means /= np.maximum(counts, 1)[:, None]
+
+    # strongest bins, skipping neighbours of an already chosen peak
+    cube = counts.reshape(bins, bins, bins)
+    peaks = []
+    for b in np.argsort(-counts):
+        if counts[b] == 0 or len(peaks) == k:
+            break
+        r, g, bl = np.unravel_index(b, cube.shape)
+        if all(max(abs(r - pr), abs(g - pg), abs(bl - pb)) > 1 for pr, pg, pb in peaks):
+            peaks.append((r, g, bl))
+    if not peaks:
+        peaks = [np.unravel_index(int(np.argmax(counts)), cube.shape)]
+    centers = np.array([means[np.ravel_multi_index(p, cube.shape)] for p in peaks])
+    return centers, _assign(pixels.astype(np.float32), centers)
+
+
+def _median_cut(pixels, k):
+    boxes = [pixels]
+    while len(boxes) < k:
+        # split the box with the widest channel range at its median
+        ranges = [np.ptp(b, axis=0).max() if len(b) > 1 else -1 for b in boxes]
+        i = int(np.argmax(ranges))
+        if ranges[i] <= 0:
+            break
+        box = boxes.pop(i)
+        ch = int(np.argmax(np.ptp(box, axis=0)))
+        order = np.argsort(box[:, ch], kind="stable")
+        half = len(box) // 2
+        boxes += [box[order[:half]], box[order[half:]]]
+    centers = np.array([b.mean(axis=0) for b in boxes])
+    return centers, _assign(pixels.astype(np.float32), centers)
+
+
+# Nearest-name lookup: one uint8 name index per 24-bit colour (256^3, 16 MB),
+# built once and cached under assets/. COLOR_NAME_SPACE=lab measures
+# distance in CIELAB instead of RGB.
+_NAME_SPACE = os.environ.get("COLOR_NAME_SPACE", "rgb").lower()
+_LUT_DIR = os.environ.get(
+    "COLOR_LUT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+)
+
+
+def _to_lab(rgb):
+    """(..., 3) RGB 0-255 -> float32 CIELAB (L 0-100)."""
+    flat = rgb.reshape(-1, 1, 3).astype(np.float32) / 255.0
+    return cv2.cvtColor(flat, cv2.COLOR_RGB2LAB).reshape(rgb.shape)
+
+
+def _build_name_lut(palette, space):
+    """
+    uint8 (256, 256, 256) index of the nearest palette entry for every colour.
+    Ties go to the later palette entry, as in the original dict-based lookup.
+    """
+    ref = palette[::-1].astype(np.float32)  # reversed: argmin's first hit == last tie
+    if space == "lab":
+        ref = _to_lab(ref)
+    # |c - p|^2 = |c|^2 - 2 c.p + |p|^2; the pixel term |c|^2 is the same for
+    # every palette entry p, so the argmin is a matmul. RGB terms are integers
+    # < 2^24, exact in float32, so ties resolve exactly as before.
+    ref_sq = (ref ** 2).sum(axis=1)
+    lut = np.empty((256, 256, 256), dtype=np.uint8)
+    g, b = np.meshgrid(np.arange(256), np.arange(256), indexing="ij")
+    for r in range(256):
+        plane = np.stack([np.full_like(g, r), g, b], axis=-1).reshape(-1, 3)
+        plane = _to_lab(plane) if space == "lab" else plane.astype(np.float32)
+        d = ref_sq - 2.0 * (plane @ ref.T)
+        lut[r] = (len(ref) - 1 - d.argmin(axis=1)).reshape(256, 256)
+    return lut
+
+
+def _load_name_lut(palette, space=_NAME_SPACE):
+    digest = hashlib.sha1(palette.astype(np.uint8).tobytes() + space.encode()).hexdigest()
+    path = os.path.join(_LUT_DIR, f"color_name_lut_{space}.npy")
+    try:
+        with open(path + ".json") as f:
+            if json.load(f).get("digest") == digest:
+                return np.load(path, mmap_mode="r")
+    except (FileNotFoundError, ValueError, OSError):
+        pass
+
+    print(f"[color] Building {space.upper()} colour-name LUT ({len(palette)} names)")
+    lut = _build_name_lut(palette, space)
+    try:
+        os.makedirs(_LUT_DIR, exist_ok=True)
+        # temp file + os.replace: other workers never map a half-written table
+        _atomic_write(path, lambda f: np.save(f, lut))
+        _atomic_write(path + ".json", lambda f: f.write(json.dumps({"digest": digest}).encode()))
+    except OSError as e:
+        print(f"[color] WARNING could not cache colour LUT to {path}: {e}")
+    return lut
+
+
+def _atomic_write(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+_CATEGORIES = np.array([
+    "black", "white", "dark gray", "gray", "light gray", "red", "green", "blue",
+    "orange", "yellow", "purple", "cyan", "brown", "mixed color",
+], dtype=object)
+
+
+def _category_indices(rgb):
+    """Vectorised ColorDetector._get_color_category: (..., 3) RGB -> index into _CATEGORIES."""
+    rgb = np.asarray(rgb).astype(np.int32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    brightness = (r + g + b) / 3
+    hi, lo = rgb.max(axis=-1), rgb.min(axis=-1)
+    flat = hi - lo < 30
+    conditions = [
+        brightness < 30,
+        (brightness > 225) & flat,
+        flat & (brightness < 100),
+        flat & (brightness < 180),
+        flat,
+        (r == hi) & (r > g + 30) & (r > b + 30),
+        (g == hi) & (g > r + 30) & (g > b + 30),
+        (b == hi) & (b > r + 30) & (b > g + 30),
+        (r > 200) & (g > 100) & (g < 200) & (b < 100),
+        (r > 200) & (g > 200) & (b < 100),
+        (r > 150) & (b > 150) & (g < 150),
+        (g > 150) & (b > 150) & (r < 150),
+        (r > 100) & (g < 100) & (b < 100),
+    ]
+    return np.select(conditions, np.arange(len(conditions)), default=len(conditions))
+
+
+def _location(cx, cy):
+    """Normalised centroid -> spoken location, e.g. "top left", "center"."""
+    col = "left" if cx < 0.33 else "right" if cx > 0.66 else "center"
+    row = "top" if cy < 0.33 else "bottom" if cy > 0.66 else "middle"
+    if row == "middle":
+        return col
+    return row if col == "center" else f"{row} {col}"
+
+
+class RegionStats:
+    """
+    Summed-area tables of one RGB view: per-channel sums and squared sums, so
+    the mean and variance of any axis-aligned box cost four lookups.
+
+    Boxes are (x1, y1, x2, y2) in view pixels, end-exclusive; `to_view` maps
+    boxes given in decoded-frame pixels onto the view.
+    """
+
+    def __init__(self, rgb, scale=(1.0, 1.0)):
+        self.height, self.width = rgb.shape[:2]
+        self.scale = scale  # (x, y) view pixels per frame pixel
+        self._sum, self._sqsum = cv2.integral2(rgb, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+    def to_view(self, boxes):
+        """Frame-pixel boxes -> integer view boxes covering them (never empty)."""
+        sx, sy = self.scale
+        b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4) * [sx, sy, sx, sy]
+        x1 = np.clip(np.floor(b[:, 0]), 0, self.width - 1).astype(int)
+        y1 = np.clip(np.floor(b[:, 1]), 0, self.height - 1).astype(int)
+        x2 = np.clip(np.ceil(b[:, 2]), x1 + 1, self.width).astype(int)
+        y2 = np.clip(np.ceil(b[:, 3]), y1 + 1, self.height).astype(int)
+        return np.stack([x1, y1, x2, y2], axis=1)
+
+    @staticmethod
+    def _box_sums(table, boxes):
+        x1, y1, x2, y2 = boxes.T
+        return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+
+    def stats(self, boxes):
+        """(N, 4) view boxes -> ((N, 3) mean RGB, (N, 3) variance)."""
+        boxes = np.asarray(boxes, dtype=int).reshape(-1, 4)
+        area = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))[:, None].astype(np.float64)
+        mean = self._box_sums(self._sum, boxes) / area
+        var = self._box_sums(self._sqsum, boxes) / area - mean ** 2
+        return mean, np.maximum(var, 0.0)
+
+    def mean(self, boxes):
+        return self.stats(boxes)[0]
+
+
+_ENGINES = {
+    "kmeans": _kmeans_sklearn,
+    "fast_kmeans": _kmeans_fast,
+    "histogram": _histogram_peaks,
+    "median_cut": _median_cut,
+}
+
+
 class ColorDetector:
+    ENGINES = tuple(_ENGINES)
+
     def __init__(self):
         """Initialize color detector"""
         self.color_names = self._get_extended_color_names()
+
+        # Precomputed nearest-name table; naming is then one array lookup
+        self._palette = np.array(list(self.color_names.keys()), dtype=np.uint8)
+        self._names = np.array(list(self.color_names.values()), dtype=object)
+        self._name_lut = _load_name_lut(self._palette)
         
     def _get_extended_color_names(self):
         """Get a comprehensive list of color names"""
@@ -104,17 +375,23 @@ class ColorDetector:
             (139, 0, 139): 'dark magenta',
         }
     
+    @property
+    def num_color_names(self):
+        """Entries in the naming palette (upper bound for detect_color_map's top)."""
+        return len(self._names)
+
+    def name_indices(self, rgb):
+        """Vectorised: (..., 3) RGB array -> (...) index into self._names."""
+        rgb = np.clip(np.asarray(rgb), 0, 255).astype(np.intp)
+        return self._name_lut[rgb[..., 0], rgb[..., 1], rgb[..., 2]]
+
+    def color_names_of(self, rgb):
+        """Vectorised: (..., 3) RGB array -> (...) array of colour names."""
+        return self._names[self.name_indices(rgb)]
+
     def _closest_color_name(self, rgb):
         """Find the closest color name for an RGB value"""
-        min_colors = {}
-        
-        for color_rgb, name in self.color_names.items():
-            rd = (rgb[0] - color_rgb[0]) ** 2
-            gd = (rgb[1] - color_rgb[1]) ** 2
-            bd = (rgb[2] - color_rgb[2]) ** 2
-            min_colors[(rd + gd + bd)] = name
-            
-        return min_colors[min(min_colors.keys())]
+        return self._names[self.name_indices(rgb)]
     
     def _get_color_category(self, rgb):
         """Categorize color into broad categories"""
@@ -171,42 +448,43 @@ class ColorDetector:
         
         return "mixed color"
     
-    def detect_color(self, image_bytes, n_colors=3):
+    def dominant_palette(self, pixels, n_colors=3, engine=None):
+        """(centers (k, 3) float, label per pixel) from the selected engine."""
+        engine = (engine or COLOR_ENGINE).lower()
+        if engine not in _ENGINES:
+            raise ValueError(f"Unknown color engine: {engine!r} (choose from {', '.join(_ENGINES)})")
+        return _ENGINES[engine](pixels, min(n_colors, len(pixels)))
+
+    def detect_color(self, image, n_colors=3, engine=None):
         """
         Detect dominant colors in an image
         
         Args:
-            image_bytes: Image as bytes
+            image: Frame, image bytes, or a decoded BGR ndarray
             n_colors: Number of dominant colors to extract
+            engine: Dominant-colour engine (see ColorDetector.ENGINES); default COLOR_ENGINE
             
         Returns:
             dict: Color detection results with dominant colors and names
         """
-        # Convert bytes to PIL Image
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        
-        # Resize for faster processing
-        image.thumbnail((300, 300))
-        
-        # Convert to numpy array
-        image_np = np.array(image)
+        # Shared RGB thumbnail for faster processing
+        image_np = Frame.coerce(image).thumbnail(300)
         
         # Reshape image to be a list of pixels
         pixels = image_np.reshape(-1, 3)
         
-        # Use KMeans to find dominant colors
-        kmeans = KMeans(n_clusters=min(n_colors, len(pixels)), random_state=42, n_init=10)
-        kmeans.fit(pixels)
+        # Find dominant colors
+        centers, labels = self.dominant_palette(pixels, n_colors, engine)
         
         # Get the colors
-        colors = kmeans.cluster_centers_.astype(int)
+        colors = centers.astype(int)
         
         # Get the count of pixels for each cluster
-        labels = kmeans.labels_
-        counts = np.bincount(labels)
+        counts = np.bincount(labels, minlength=len(colors))
         
-        # Sort colors by frequency
+        # Sort colors by frequency (clusters left without pixels are dropped)
         indices = np.argsort(-counts)
+        indices = indices[counts[indices] > 0]
         sorted_colors = colors[indices]
         sorted_counts = counts[indices]
         
@@ -243,38 +521,40 @@ class ColorDetector:
             'primary_color': primary_color,
             'color_count': len(dominant_colors),
             'image_size': {
-                'width': image.width,
-                'height': image.height
+                'width': image_np.shape[1],
+                'height': image_np.shape[0]
             }
         }
     
-    def detect_color_simple(self, image_bytes):
+    def region_stats(self, image, max_dim=_BOX_COLOR_DIM):
+        """
+        RegionStats of the frame's max_dim thumbnail, built once per frame
+        and shared by every region query on it
+        """
+        frame = Frame.coerce(image)
+
+        def build():
+            view = frame.thumbnail(max_dim)
+            return RegionStats(view, scale=(view.shape[1] / frame.width, view.shape[0] / frame.height))
+        return frame.cached(("region_stats", max_dim), build)
+
+    def detect_color_simple(self, image):
         """
         Detect single dominant color - optimized for real-time feedback
         
         Args:
-            image_bytes: Image as bytes
+            image: Frame, image bytes, or a decoded BGR ndarray
             
         Returns:
             dict: Single dominant color information
         """
-        # Convert bytes to PIL Image
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        
-        # Resize to very small for fast processing
-        image.thumbnail((100, 100))
-        
-        # Convert to numpy array
-        image_np = np.array(image)
+        # Very small RGB thumbnail for fast processing
+        stats = self.region_stats(image, 100)
         
-        # Get center region (middle 50% of image) for more accurate color
-        h, w = image_np.shape[:2]
-        center_h_start, center_h_end = h // 4, 3 * h // 4
-        center_w_start, center_w_end = w // 4, 3 * w // 4
-        center_region = image_np[center_h_start:center_h_end, center_w_start:center_w_end]
-        
-        # Calculate average color of center region
-        avg_color = center_region.reshape(-1, 3).mean(axis=0).astype(int)
+        # Average color of the center region (middle 50% of image) for more accurate color
+        h, w = stats.height, stats.width
+        center = (w // 4, h // 4, max(3 * w // 4, w // 4 + 1), max(3 * h // 4, h // 4 + 1))
+        avg_color = stats.mean(center)[0].astype(int)
         # Convert numpy integers to Python integers for JSON serialization
         rgb = tuple(int(x) for x in avg_color)
         
@@ -288,4 +568,127 @@ class ColorDetector:
             'name': color_name,
             'category': category,
             'description': f"The dominant color is {color_name}"
-        }
\ No newline at end of file
+        }
+
+    def _describe_colors(self, means):
+        """(N, 3) mean RGB -> detect_color_simple-style dicts, named in one LUT pass."""
+        means = np.asarray(means).astype(int).reshape(-1, 3)
+        names = self.color_names_of(means)
+        categories = _CATEGORIES[_category_indices(means)]
+        results = []
+        for rgb, color_name, category in zip(means.tolist(), names, categories):
+            rgb = tuple(rgb)
+            results.append({
+                'rgb': rgb,
+                'hex': '#{:02x}{:02x}{:02x}'.format(*rgb),
+                'name': color_name,
+                'category': category,
+                'description': f"The dominant color is {color_name}"
+            })
+        return results
+
+    def detect_box_colors(self, image, boxes, max_dim=_BOX_COLOR_DIM):
+        """
+        detect_color_simple for many boxes of one frame, without cropping
+        
+        Args:
+            image: Frame, image bytes, or a decoded BGR ndarray
+            boxes: (x1, y1, x2, y2) boxes in decoded-frame pixels
+            max_dim: Side of the shared downscaled view the means are taken on
+            
+        Returns:
+            list: One color dict per box (same fields as detect_color_simple)
+        """
+        if len(boxes) == 0:
+            return []
+        stats = self.region_stats(image, max_dim)
+
+        # centre 50% of each box (as detect_color_simple), then O(1) means
+        b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        bw, bh = b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]
+        centre = np.stack([b[:, 0] + bw / 4, b[:, 1] + bh / 4, b[:, 0] + 3 * bw / 4, b[:, 1] + 3 * bh / 4], axis=1)
+        return self._describe_colors(stats.mean(stats.to_view(centre)))
+
+    def detect_color_map(self, image, size=150, top=8, masks=False, grid=8):
+        """
+        Name every thumbnail pixel in one vectorised LUT pass
+        
+        Args:
+            image: Frame, image bytes, or a decoded BGR ndarray
+            size: Thumbnail size the map is computed on
+            top: Number of colour names to report (by area)
+            masks: Include a coarse grid x grid mask per reported name
+            grid: Mask resolution (cells per side)
+            
+        Returns:
+            dict: Per-name area fractions, locations and optional region masks
+        """
+        image_np = Frame.coerce(image).thumbnail(size)
+        h, w = image_np.shape[:2]
+        n_names = len(self._names)
+
+        idx = self.name_indices(image_np).astype(np.intp).ravel()      # (H*W,)
+        total = idx.size
+        counts = np.bincount(idx, minlength=n_names)
+
+        # per-name centroid / bounds and mean colour
+        ys, xs = np.divmod(np.arange(total), w)
+        cx = np.bincount(idx, weights=xs, minlength=n_names) / np.maximum(counts, 1) / w
+        cy = np.bincount(idx, weights=ys, minlength=n_names) / np.maximum(counts, 1) / h
+        pixels = image_np.reshape(-1, 3)
+        mean_rgb = np.stack(
+            [np.bincount(idx, weights=pixels[:, c], minlength=n_names) for c in range(3)], axis=1
+        ) / np.maximum(counts, 1)[:, None]
+
+        x_min, y_min = np.full(n_names, w), np.full(n_names, h)
+        x_max, y_max = np.zeros(n_names, dtype=int), np.zeros(n_names, dtype=int)
+        np.minimum.at(x_min, idx, xs)
+        np.maximum.at(x_max, idx, xs)
+        np.minimum.at(y_min, idx, ys)
+        np.maximum.at(y_max, idx, ys)
+
+        # coarse masks: share of each grid cell covered by each name
+        if masks:
+            cell = (ys * grid // h) * grid + (xs * grid // w)
+            joint = np.bincount(idx * grid * grid + cell, minlength=n_names * grid * grid)
+            cell_share = joint.reshape(n_names, grid * grid) / np.maximum(np.bincount(cell, minlength=grid * grid), 1)
+
+        cat = _category_indices(image_np).ravel()
+        cat_counts = np.bincount(cat, minlength=len(_CATEGORIES))
+
+        colors = []
+        for i in np.argsort(-counts, kind="stable")[:top]:
+            if counts[i] == 0:
+                break
+            rgb = tuple(int(v) for v in mean_rgb[i])
+            entry = {
+                'name': self._names[i],
+                'category': self._get_color_category(rgb),
+                'rgb': rgb,
+                'hex': '#{:02x}{:02x}{:02x}'.format(*rgb),
+                'fraction': round(counts[i] / total, 4),
+                'percentage': round(counts[i] / total * 100, 2),
+                'centroid': {'x': round(float(cx[i]), 3), 'y': round(float(cy[i]), 3)},
+                'bbox': {
+                    'x1': round(x_min[i] / w, 3), 'y1': round(y_min[i] / h, 3),
+                    'x2': round((x_max[i] + 1) / w, 3), 'y2': round((y_max[i] + 1) / h, 3),
+                },
+                'location': _location(cx[i], cy[i]),
+            }
+            if masks:
+                entry['mask'] = (cell_share[i] >= 0.25).astype(int).reshape(grid, grid).tolist()
+            colors.append(entry)
+
+        categories = [
+            {'category': _CATEGORIES[c], 'fraction': round(cat_counts[c] / total, 4)}
+            for c in np.argsort(-cat_counts, kind="stable") if cat_counts[c] > 0
+        ]
+
+        parts = [f"{c['name']} {round(c['percentage'])}% {c['location']}" for c in colors[:3]]
+        return {
+            'colors': colors,
+            'categories': categories,
+            'mask_grid': grid if masks else None,
+            'description': "Mostly " + ", ".join(parts) if parts else "No colors detected",
+            'image_size': {'width': w, 'height': h},
+        }
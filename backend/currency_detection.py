@@ -1,19 +1,38 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
 import cv2
 import numpy as np
-from PIL import Image
-import io
+
+from frame import Frame, encode_image
+from services.tflite_pool import InterpreterPool
 
 import tensorflow as tf
 Interpreter = tf.lite.Interpreter
 
+_LETTERBOX_FILL = 114
+
+# class-agnostic rotated NMS: one physical note is one value, whatever its label
+_NMS_IOU = float(os.environ.get("CURRENCY_NMS_IOU", "0.5"))
+
+# session mode: a total is stable once the same note composition was seen in
+# CURRENCY_CONSENSUS_MIN of the last CURRENCY_CONSENSUS_FRAMES frames
+_CONSENSUS_FRAMES = int(os.environ.get("CURRENCY_CONSENSUS_FRAMES", "5"))
+_CONSENSUS_MIN = int(os.environ.get("CURRENCY_CONSENSUS_MIN", "3"))
+_SESSION_TTL_SEC = float(os.environ.get("CURRENCY_SESSION_TTL_SEC", "30"))
+
 
 class CurrencyDetector:
     def __init__(self, model_path='assets/yolo26-obb-tflite.tflite'):
-        self.interpreter = Interpreter(model_path=model_path, num_threads=4)
-        self.interpreter.allocate_tensors()
+        # One interpreter per concurrent request (TFLITE_INTERPRETERS x TFLITE_THREADS)
+        self._pool = InterpreterPool(
+            lambda num_threads: Interpreter(model_path=model_path, num_threads=num_threads)
+        )
 
-        self.input_details  = self.interpreter.get_input_details()
-        self.output_details = self.interpreter.get_output_details()
+        self.input_details  = self._pool.interpreters[0].get_input_details()
+        self.output_details = self._pool.interpreters[0].get_output_details()
 
         self._input_dtype = self.input_details[0]['dtype']
         self._input_shape = self.input_details[0]['shape']  # [1, 640, 640, 3]
@@ -23,6 +42,12 @@ class CurrencyDetector:
         out_shape         = self.output_details[0]['shape']  # [1, 300, 7]
         self._det_cols    = int(out_shape[2])
 
+        # per-interpreter resize buffer, reused by every request on that interpreter
+        self._scratch = {
+            id(interpreter): np.empty(self._model_h * self._model_w * 3, dtype=np.uint8)
+            for interpreter in self._pool.interpreters
+        }
+
         self.class_names = self._load_labels(
             model_path.replace('.tflite', '_labels.txt')
         ) or {
@@ -35,63 +60,101 @@ class CurrencyDetector:
             6: '5000',
         }
 
+        self._class_cache = {}
+
         print(f"[CurrencyDetector] Loaded: {model_path}")
         print(f"  Input  : {self._input_shape}  {self._input_dtype}")
         print(f"  Output : {out_shape}")
         print(f"  Classes: {list(self.class_names.values())}")
+        print(f"  Pool   : {self._pool.size} interpreters x {self._pool.num_threads} threads")
 
     # ══════════════════════════════════════════════════════════════════════════
     #  Public API
     # ══════════════════════════════════════════════════════════════════════════
 
-    def detect_currency(self, image_bytes, conf_threshold=0.25):
-        image, image_np = self._image_from_bytes(image_bytes)
-        detections      = self._run_inference(image_np, conf_threshold)
+    # `image` is a Frame, raw bytes or an already-decoded BGR ndarray (OpenCV order)
+
+    def detect_currency(self, image, conf_threshold=0.25):
+        frame           = Frame.coerce(image)
+        detections      = self._run_inference(frame, conf_threshold)
         total_amount    = sum(d['value'] for d in detections if d['value'])
         return {
             'detections':   detections,
             'count':        len(detections),
             'total_amount': total_amount,
-            'image_size':   {'width': image.width, 'height': image.height}
+            'image_size':   {'width': frame.orig_width, 'height': frame.orig_height}
         }
 
-    def detect_and_draw(self, image_bytes, conf_threshold=0.25):
-        image, image_np = self._image_from_bytes(image_bytes)
-        detections      = self._run_inference(image_np, conf_threshold)
-        canvas          = image_np.copy()
-        for det in detections:
-            canvas = self._draw_detection(canvas, det)
-        buf = io.BytesIO()
-        Image.fromarray(canvas).save(buf, format='PNG')
-        buf.seek(0)
-        return buf.getvalue()
+    def interpreter_stats(self):
+        return self._pool.snapshot()
+
+    def detect_and_draw(self, image, conf_threshold=0.25, fmt="png", quality=80):
+        frame           = Frame.coerce(image)
+        result          = self.detect_currency(frame, conf_threshold)
+        canvas          = self.draw_detections(frame, result)
+        return encode_image(canvas, fmt=fmt, quality=quality)[0]
+
+    def draw_detections(self, image, result):
+        """Draw a detect_currency() result onto a BGR copy of the frame."""
+        frame           = Frame.coerce(image)
+        canvas          = frame.bgr.copy()
+        for det in result['detections']:
+            canvas = self._draw_detection(canvas, det, frame.scale)
+        return canvas
 
     # ══════════════════════════════════════════════════════════════════════════
     #  Inference
     # ══════════════════════════════════════════════════════════════════════════
 
-    def _run_inference(self, image_np: np.ndarray, conf_threshold: float):
-        orig_h, orig_w = image_np.shape[:2]
-
-        # 1. Letterbox resize
-        input_img, scale, pad_left, pad_top = self._letterbox(
-            image_np, self._model_w, self._model_h
-        )
-
-        # 2. Normalize
-        if self._input_dtype == np.uint8:
-            input_tensor = input_img.astype(np.uint8)
+    def _run_inference(self, frame: Frame, conf_threshold: float):
+        orig_h, orig_w = frame.orig_height, frame.orig_width
+        src = frame.bgr
+
+        # 1. Letterbox geometry (the TFLite model was exported for RGB input)
+        h, w = src.shape[:2]
+        scale = min(self._model_w / w, self._model_h / h)
+        new_w, new_h = int(round(w * scale)), int(round(h * scale))
+        pad_left, pad_top = (self._model_w - new_w) // 2, (self._model_h - new_h) // 2
+
+        with self._pool.checkout() as interpreter:
+            # 2. Resize into this interpreter's scratch buffer (contiguous view, no allocation)
+            resized = self._scratch[id(interpreter)][:new_h * new_w * 3].reshape(new_h, new_w, 3)
+            cv2.resize(src, (new_w, new_h), dst=resized, interpolation=cv2.INTER_LINEAR)
+
+            # 3. Letterbox + BGR->RGB + normalize straight into the input tensor
+            self._fill_input(interpreter.tensor(self.input_details[0]['index'])()[0],
+                             resized, pad_left, pad_top)
+
+            # 4. Run; keep only the rows above threshold (the output view must be
+            #    released before this interpreter goes back to the pool)
+            interpreter.invoke()
+            out  = interpreter.tensor(self.output_details[0]['index'])()[0]
+            dets = out[out[:, 4] >= conf_threshold]
+            del out
+
+        scale /= frame.scale  # letterbox px per original (not decoded) px
+
+        # 5. Parse
+        return self._parse_output(dets, conf_threshold, orig_w, orig_h, scale, pad_left, pad_top)
+
+    def _fill_input(self, inp, resized, pad_left, pad_top):
+        """Write a letterboxed RGB frame into the (H, W, 3) input view in place."""
+        new_h, new_w = resized.shape[:2]
+        is_float = self._input_dtype != np.uint8
+        fill = _LETTERBOX_FILL / 255.0 if is_float else _LETTERBOX_FILL
+
+        # only the padding bands are filled; the image area is overwritten below
+        inp[:pad_top] = fill
+        inp[pad_top + new_h:] = fill
+        inp[pad_top:pad_top + new_h, :pad_left] = fill
+        inp[pad_top:pad_top + new_h, pad_left + new_w:] = fill
+
+        region = inp[pad_top:pad_top + new_h, pad_left:pad_left + new_w]
+        rgb = resized[..., ::-1]
+        if is_float:
+            np.multiply(rgb, np.float32(1.0 / 255.0), out=region)
         else:
-            input_tensor = (input_img / 255.0).astype(np.float32)
-        input_tensor = np.expand_dims(input_tensor, 0)  # (1,640,640,3)
-
-        # 3. Run
-        self.interpreter.set_tensor(self.input_details[0]['index'], input_tensor)
-        self.interpreter.invoke()
-        raw = self.interpreter.get_tensor(self.output_details[0]['index'])
-
-        # 4. Parse
-        return self._parse_output(raw, conf_threshold, orig_w, orig_h, scale, pad_left, pad_top)
+            region[...] = rgb
 
     # ══════════════════════════════════════════════════════════════════════════
     #  Parser — confirmed layout: [cx, cy, w, h, conf, class_id, angle]
@@ -99,104 +162,111 @@ class CurrencyDetector:
     # ══════════════════════════════════════════════════════════════════════════
 
     def _parse_output(self, raw, conf_threshold, orig_w, orig_h, scale, pad_left, pad_top):
-        dets  = np.squeeze(raw, axis=0)      # (300, 7)
-        confs = dets[:, 4]
-        dets  = dets[confs >= conf_threshold]
+        dets  = raw.reshape(-1, raw.shape[-1])   # (300, 7) or already-filtered rows
+        dets  = dets[dets[:, 4] >= conf_threshold].astype(np.float64)
 
         if len(dets) == 0:
             return []
 
+        # Normalized letterbox coords → original image coords, whole array at once
+        cx = (dets[:, 0] * self._model_w - pad_left) / scale
+        cy = (dets[:, 1] * self._model_h - pad_top)  / scale
+        w  =  dets[:, 2] * self._model_w / scale
+        h  =  dets[:, 3] * self._model_h / scale
+        confidence = dets[:, 4]
+        class_id   = np.rint(dets[:, 5]).astype(np.int64)
+        angle_rad  = dets[:, 6] if self._det_cols >= 7 else np.zeros(len(dets))
+
+        x1 = np.maximum(0.0,          cx - w / 2)
+        y1 = np.maximum(0.0,          cy - h / 2)
+        x2 = np.minimum(float(orig_w), cx + w / 2)
+        y2 = np.minimum(float(orig_h), cy + h / 2)
+
+        keep = (x2 > x1) & (y2 > y1)
+        if not keep.any():
+            return []
+        cx, cy, w, h, confidence, class_id, angle_rad = (
+            a[keep] for a in (cx, cy, w, h, confidence, class_id, angle_rad)
+        )
+        x1, y1, x2, y2 = x1[keep], y1[keep], x2[keep], y2[keep]
+        corners = self._obb_to_corners(cx, cy, w, h, angle_rad)   # (N, 4, 2)
+
+        # Overlapping duplicate OBBs would be counted twice in total_amount
+        nms = obb_nms(corners, confidence, _NMS_IOU)
+        if len(nms) < len(corners):
+            cx, cy, w, h, confidence, class_id, angle_rad, corners = (
+                a[nms] for a in (cx, cy, w, h, confidence, class_id, angle_rad, corners)
+            )
+            x1, y1, x2, y2 = x1[nms], y1[nms], x2[nms], y2[nms]
+
+        # Single conversion to Python objects
+        rounded = np.round(np.stack([x1, y1, x2, y2, cx, cy, w, h]), 2).T.tolist()
         results = []
-        for row in dets:
-            # Coords are normalized → convert to letterbox pixel space first
-            cx_lb = float(row[0]) * self._model_w
-            cy_lb = float(row[1]) * self._model_h
-            w_lb  = float(row[2]) * self._model_w
-            h_lb  = float(row[3]) * self._model_h
-
-            confidence = float(row[4])
-            class_id   = int(round(float(row[5])))
-            angle_rad  = float(row[6]) if self._det_cols >= 7 else 0.0
-
-            # Remove letterbox padding + scale to original image coords
-            cx = (cx_lb - pad_left) / scale
-            cy = (cy_lb - pad_top)  / scale
-            w  = w_lb  / scale
-            h  = h_lb  / scale
-
-            x1 = max(0.0,          cx - w / 2)
-            y1 = max(0.0,          cy - h / 2)
-            x2 = min(float(orig_w), cx + w / 2)
-            y2 = min(float(orig_h), cy + h / 2)
-
-            if x2 <= x1 or y2 <= y1:
-                continue
-
-            corners        = self._obb_to_corners(cx, cy, w, h, angle_rad)
-            class_name     = self.class_names.get(class_id, f'class_{class_id}')
-            currency_value = self._extract_value(class_name)
-
+        for (bx1, by1, bx2, by2, ocx, ocy, ow, oh), cid, conf, ang, pts in zip(
+            rounded, class_id.tolist(), np.round(confidence, 4).tolist(),
+            np.round(angle_rad, 6).tolist(), corners.tolist()
+        ):
+            class_name, currency_value = self._class_info(cid)
             results.append({
                 'class':      class_name,
-                'class_id':   class_id,
-                'confidence': round(confidence, 4),
+                'class_id':   cid,
+                'confidence': conf,
                 'value':      currency_value,
                 'bbox': {
-                    'x1': round(x1, 2), 'y1': round(y1, 2),
-                    'x2': round(x2, 2), 'y2': round(y2, 2)
+                    'x1': bx1, 'y1': by1,
+                    'x2': bx2, 'y2': by2
                 },
                 'obb': {
-                    'cx':        round(cx, 2),
-                    'cy':        round(cy, 2),
-                    'width':     round(w,  2),
-                    'height':    round(h,  2),
-                    'angle_rad': round(angle_rad, 6),
-                    'corners':   corners.tolist()
+                    'cx':        ocx,
+                    'cy':        ocy,
+                    'width':     ow,
+                    'height':    oh,
+                    'angle_rad': ang,
+                    'corners':   pts
                 }
             })
 
         return results
 
+    def _class_info(self, class_id):
+        """(class name, rupee value) for a class id, memoised per detector."""
+        info = self._class_cache.get(class_id)
+        if info is None:
+            class_name = self.class_names.get(class_id, f'class_{class_id}')
+            info = self._class_cache[class_id] = (class_name, self._extract_value(class_name))
+        return info
+
     # ══════════════════════════════════════════════════════════════════════════
     #  Helpers
     # ══════════════════════════════════════════════════════════════════════════
 
-    @staticmethod
-    def _letterbox(img, target_w, target_h):
-        h, w    = img.shape[:2]
-        scale   = min(target_w / w, target_h / h)
-        new_w   = int(round(w * scale))
-        new_h   = int(round(h * scale))
-        pad_l   = (target_w - new_w) // 2
-        pad_t   = (target_h - new_h) // 2
-        resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-        canvas  = np.full((target_h, target_w, 3), 114, dtype=np.uint8)
-        canvas[pad_t:pad_t + new_h, pad_l:pad_l + new_w] = resized
-        return canvas, scale, pad_l, pad_t
-
     @staticmethod
     def _obb_to_corners(cx, cy, w, h, angle_rad):
-        cos_a, sin_a = np.cos(angle_rad), np.sin(angle_rad)
-        hw, hh   = w / 2, h / 2
-        offsets  = np.array([[-hw,-hh],[hw,-hh],[hw,hh],[-hw,hh]], dtype=np.float32)
-        rot      = np.array([[cos_a, -sin_a],[sin_a, cos_a]])
-        return (offsets @ rot.T) + np.array([cx, cy])
-
-    def _draw_detection(self, img, det):
+        """Arrays of N boxes → (N, 4, 2) corners: TL, TR, BR, BL before rotation."""
+        cos_a, sin_a = np.cos(angle_rad)[:, None], np.sin(angle_rad)[:, None]
+        ox = np.stack([-w, w, w, -w], axis=1) / 2
+        oy = np.stack([-h, -h, h, h], axis=1) / 2
+        return np.stack([
+            ox * cos_a - oy * sin_a + cx[:, None],
+            ox * sin_a + oy * cos_a + cy[:, None],
+        ], axis=2)
+
+    def _draw_detection(self, img, det, scale=1.0):
+        """img is BGR; det coordinates are in upload pixels (divided by scale)."""
         COLORS = [
             (255,56,56),(255,157,151),(255,112,31),(255,178,29),
             (207,210,49),(72,249,10),(146,204,23)
         ]
-        color   = COLORS[det['class_id'] % len(COLORS)]
-        corners = np.array(det['obb']['corners'], dtype=np.int32)
+        color   = COLORS[det['class_id'] % len(COLORS)][::-1]  # RGB -> BGR
+        corners = np.rint(np.array(det['obb']['corners']) / scale).astype(np.int32)
         cv2.polylines(img, [corners], isClosed=True, color=color, thickness=2)
 
         label = f"{det['class']} {det['confidence']:.0%}"
         if det['value']:
             label += f" Rs{det['value']}"
 
-        x1 = int(det['bbox']['x1'])
-        y1 = int(det['bbox']['y1'])
+        x1 = int(det['bbox']['x1'] / scale)
+        y1 = int(det['bbox']['y1'] / scale)
         (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.55, 2)
         cv2.rectangle(img, (x1, y1 - th - 6), (x1 + tw + 4, y1), color, -1)
         cv2.putText(img, label, (x1+2, y1-4),
@@ -210,16 +280,146 @@ class CurrencyDetector:
         except (ValueError, TypeError):
             return None
 
-    @staticmethod
-    def _image_from_bytes(image_bytes):
-        image    = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        image_np = np.array(image)
-        return image, image_np
-
     @staticmethod
     def _load_labels(path):
         try:
             with open(path) as f:
                 return {i: l.strip() for i, l in enumerate(f) if l.strip()}
         except FileNotFoundError:
-            return {}
\ No newline at end of file
+            return {}
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  Rotated-box NMS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _polygon_area(pts):
+    """Shoelace area of (P, K, 2) closed polygons."""
+    x, y = pts[..., 0], pts[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1))
+
+
+def _inside(points, quads, eps=1e-6):
+    """(P, M, 2) points inside (P, 4, 2) convex quads (either winding) → (P, M) bool."""
+    edges = np.roll(quads, -1, axis=1) - quads                       # (P, 4, 2)
+    rel = points[:, :, None, :] - quads[:, None, :, :]               # (P, M, 4, 2)
+    cross = edges[:, None, :, 0] * rel[..., 1] - edges[:, None, :, 1] * rel[..., 0]
+    return np.all(cross >= -eps, axis=2) | np.all(cross <= eps, axis=2)
+
+
+def rotated_iou(a, b):
+    """
+    IoU of P pairs of rotated boxes given as (P, 4, 2) corners.
+    Intersection polygon = corners of each box inside the other plus all
+    edge crossings, sorted by angle around their centroid.
+    """
+    p = len(a)
+    if p == 0:
+        return np.zeros(0)
+
+    # edge-edge crossings: a_i + t (a_i+1 - a_i) == b_j + u (b_j+1 - b_j)
+    da = (np.roll(a, -1, axis=1) - a)[:, :, None, :]                 # (P, 4, 1, 2)
+    db = (np.roll(b, -1, axis=1) - b)[:, None, :, :]                 # (P, 1, 4, 2)
+    diff = b[:, None, :, :] - a[:, :, None, :]                       # (P, 4, 4, 2)
+    denom = da[..., 0] * db[..., 1] - da[..., 1] * db[..., 0]
+    safe = np.where(np.abs(denom) < 1e-9, 1.0, denom)
+    t = (diff[..., 0] * db[..., 1] - diff[..., 1] * db[..., 0]) / safe
+    u = (diff[..., 0] * da[..., 1] - diff[..., 1] * da[..., 0]) / safe
+    hit = (np.abs(denom) >= 1e-9) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    crossings = (a[:, :, None, :] + t[..., None] * da).reshape(p, 16, 2)
+
+    pts = np.concatenate([a, b, crossings], axis=1)                  # (P, 24, 2)
+    valid = np.concatenate([_inside(a, b), _inside(b, a), hit.reshape(p, 16)], axis=1)
+
+    # sort valid points by angle around their centroid; pad with the first one
+    n_valid = valid.sum(axis=1)
+    centroid = (pts * valid[..., None]).sum(axis=1) / np.maximum(n_valid, 1)[:, None]
+    angle = np.arctan2(pts[..., 1] - centroid[:, None, 1], pts[..., 0] - centroid[:, None, 0])
+    order = np.argsort(np.where(valid, angle, np.inf), axis=1)
+    pts = np.take_along_axis(pts, order[..., None], axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    pts = np.where(valid[..., None], pts, pts[:, :1])
+
+    inter = np.where(n_valid >= 3, _polygon_area(pts), 0.0)
+    union = _polygon_area(a) + _polygon_area(b) - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def obb_nms(corners, scores, iou_threshold=_NMS_IOU):
+    """Greedy NMS over (N, 4, 2) rotated boxes. Returns kept indices in input order."""
+    n = len(corners)
+    if n < 2:
+        return np.arange(n)
+
+    # exact IoU only for pairs whose axis-aligned hulls overlap
+    lo, hi = corners.min(axis=1), corners.max(axis=1)
+    i, j = np.triu_indices(n, k=1)
+    overlap = np.all((lo[i] < hi[j]) & (lo[j] < hi[i]), axis=1)
+    i, j = i[overlap], j[overlap]
+    if len(i) == 0:
+        return np.arange(n)
+
+    iou = np.zeros((n, n))
+    iou[i, j] = iou[j, i] = rotated_iou(corners[i], corners[j])
+
+    suppressed = np.zeros(n, dtype=bool)
+    for k in np.argsort(-scores, kind="stable"):
+        if suppressed[k]:
+            continue
+        dup = iou[k] > iou_threshold
+        dup[k] = False
+        suppressed |= dup
+    return np.flatnonzero(~suppressed)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  Session consensus
+# ══════════════════════════════════════════════════════════════════════════════
+
+class CurrencyConsensus:
+    """
+    Fuses detect_currency() results across consecutive frames from one client
+    (keyed by session id) and reports a total only once it is stable.
+    """
+
+    def __init__(self, frames=_CONSENSUS_FRAMES, min_agree=_CONSENSUS_MIN, ttl_sec=_SESSION_TTL_SEC):
+        self.frames = max(1, frames)
+        self.min_agree = max(1, min(min_agree, self.frames))
+        self.ttl_sec = ttl_sec
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def update(self, session_id, result):
+        """Add one frame's result; returns the session's consensus state."""
+        now = time.monotonic()
+        composition = tuple(sorted(Counter(d['value'] for d in result['detections'] if d['value']).items()))
+
+        with self._lock:
+            for sid in [sid for sid, st in self._sessions.items() if now - st['seen'] > self.ttl_sec]:
+                del self._sessions[sid]
+
+            state = self._sessions.setdefault(
+                # starts as "no notes", so a new session pointed at nothing stays silent
+                session_id, {'history': deque(maxlen=self.frames), 'announced': (), 'seen': now}
+            )
+            state['seen'] = now
+            state['history'].append(composition)
+
+            best, votes = Counter(state['history']).most_common(1)[0]
+            stable = votes >= self.min_agree
+            announce = stable and best != state['announced']
+            if announce:
+                state['announced'] = best
+
+            return {
+                'stable':       stable,
+                'announce':     announce,
+                'total_amount': sum(v * n for v, n in best) if stable else None,
+                'notes':        {str(v): n for v, n in best} if stable else None,
+                'frames':       len(state['history']),
+                'agreement':    votes,
+            }
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
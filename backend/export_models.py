@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+YOLO runtime export + accuracy check for V-EYE
+================================================
+
+Exports the ultralytics checkpoints (washroom_kitchen_only.pt, yolov8n.pt,
+clothes_best_v4.pt) to ONNX or OpenVINO next to the .pt files, the same
+artifacts the server loads with YOLO_RUNTIME=onnx|openvino. With --check it
+runs a folder of sample frames through both PyTorch and the exported model
+and compares the box sets.
+
+Usage:
+    python export_models.py --runtime onnx
+    python export_models.py --runtime openvino --check samples/ --conf 0.25
+
+Exit status is 1 if --check finds a model whose box sets differ from PyTorch
+beyond --min-match (recall or precision of matched boxes).
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+from services import model_runtime
+
+
+_ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+DEFAULT_MODELS = [
+    os.environ.get("CUSTOM_MODEL_PATH", os.path.join(_ASSETS_DIR, "washroom_kitchen_only.pt")),
+    os.environ.get("COCO_MODEL_PATH", os.path.join(_ASSETS_DIR, "yolov8n.pt")),
+    os.environ.get("CLOTHES_MODEL_PATH", os.path.join(_ASSETS_DIR, "clothes_best_v4.pt")),
+]
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+
+
+def sample_images(folder):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(folder, pattern)))
+    return sorted(paths)
+
+
+def check_model(pt_path, artifact, images, runtime, conf, iou):
+    """Compare exported-model boxes against PyTorch on every sample image."""
+    from ultralytics import YOLO
+
+    reference = YOLO(pt_path)
+    candidate = YOLO(artifact, task="detect")
+
+    per_image = []
+    for path in images:
+        ref = reference(path, conf=conf, imgsz=model_runtime.YOLO_IMGSZ, verbose=False)[0]
+        cand = candidate(path, conf=conf, imgsz=model_runtime.YOLO_IMGSZ, verbose=False)[0]
+        per_image.append(model_runtime.compare_results(ref, cand, iou_threshold=iou))
+
+    report = model_runtime.summarize(per_image)
+    report.update({"model": os.path.basename(pt_path), "runtime": runtime})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export V-EYE YOLO models to a faster CPU runtime")
+    parser.add_argument("--runtime", choices=["onnx", "openvino"], default="onnx")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS, help="checkpoint paths (.pt)")
+    parser.add_argument("--imgsz", type=int, default=model_runtime.YOLO_IMGSZ)
+    parser.add_argument("--dynamic", action="store_true", help="dynamic batch axis (needed with YOLO_BATCH_WINDOW_MS)")
+    parser.add_argument("--force", action="store_true", help="re-export even if a cached artifact is fresh")
+    parser.add_argument("--check", metavar="DIR", help="folder of sample frames to compare against PyTorch")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a box to count as matched")
+    parser.add_argument("--min-match", type=float, default=0.98, help="minimum box recall/precision vs PyTorch")
+    args = parser.parse_args()
+
+    images = sample_images(args.check) if args.check else []
+    if args.check and not images:
+        print(f"No images found in {args.check}")
+        sys.exit(1)
+
+    failed = False
+    for pt_path in args.models:
+        if not os.path.exists(pt_path):
+            print(f"[skip] {pt_path} not found")
+            continue
+
+        artifact = model_runtime.export_yolo(
+            pt_path, args.runtime, imgsz=args.imgsz, dynamic=args.dynamic or None, force=args.force
+        )
+        print(f"[ok] {os.path.basename(pt_path)} -> {artifact}")
+
+        if images:
+            report = check_model(pt_path, artifact, images, args.runtime, args.conf, args.iou)
+            print(json.dumps(report, indent=2))
+            scores = [report["recall"], report["precision"]]
+            if any(v is not None and v < args.min_match for v in scores):
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
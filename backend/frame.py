@@ -0,0 +1,208 @@
+import io
+import os
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Decode oversized JPEGs at 1/2, 1/4 or 1/8 resolution (DCT scaling) when the
+# consumer only needs a smaller image. Set FRAME_REDUCED_DECODE=0 to disable.
+_REDUCED_DECODE = os.environ.get("FRAME_REDUCED_DECODE", "1") != "0"
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class Frame:
+    """
+    One uploaded image, decoded once per request and shared by every detector.
+
+    Holds the raw bytes, a single decoded BGR buffer (OpenCV order, EXIF
+    orientation applied by cv2.imdecode) and lazily cached derived views:
+    RGB, grayscale, max-side resizes, thumbnails and letterboxes. Views are
+    computed on first use and reused by every later consumer.
+
+    Detectors accept a Frame, raw bytes or a decoded BGR ndarray; use
+    Frame.coerce() to normalise.
+
+    target_dim: the largest side any consumer of this frame needs. JPEGs much
+    larger than that are decoded at reduced resolution; `scale` then maps
+    decoded pixel coordinates back to the original upload.
+    """
+
+    def __init__(self, data=None, bgr=None, target_dim=None):
+        if data is None and bgr is None:
+            raise ValueError("Frame needs either encoded bytes or a decoded BGR array")
+        self.data = data
+        self.target_dim = target_dim
+        self.scale = 1.0  # original pixels per decoded pixel
+        self._bgr = bgr
+        self._orig_size = None
+        self._views = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def coerce(cls, image):
+        if isinstance(image, Frame):
+            return image
+        if isinstance(image, np.ndarray):
+            return cls(bgr=image)
+        return cls(data=bytes(image))
+
+    # ------------------------------------------------------------------
+    #  Decoding
+    # ------------------------------------------------------------------
+
+    def _reduction(self):
+        """(factor, header size) for a reduced JPEG decode, or (1, None)."""
+        if not (_REDUCED_DECODE and self.target_dim and self.data[:2] == b"\xff\xd8"):
+            return 1, None
+        try:
+            # header only; no pixel data is decoded here
+            size = Image.open(io.BytesIO(self.data)).size
+        except Exception:
+            return 1, None
+        for factor, _ in _REDUCED_FLAGS:
+            if max(size) / factor >= self.target_dim:
+                return factor, size
+        return 1, size
+
+    def decode(self):
+        """Decode the bytes (once). Returns the BGR array, or None if undecodable."""
+        if self._bgr is None and self.data:
+            buf = np.frombuffer(self.data, dtype=np.uint8)
+            factor, size = self._reduction()
+            flag = dict(_REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR)
+            self._bgr = cv2.imdecode(buf, flag)
+            if self._bgr is not None and factor > 1:
+                h, w = self._bgr.shape[:2]
+                # EXIF rotation may have swapped the header's width/height
+                ow, oh = size if (w >= h) == (size[0] >= size[1]) else size[::-1]
+                self._orig_size = (ow, oh)
+                self.scale = max(ow, oh) / max(w, h)
+        return self._bgr
+
+    @property
+    def bgr(self):
+        bgr = self.decode()
+        if bgr is None:
+            raise ValueError("Could not decode image")
+        return bgr
+
+    @property
+    def height(self):
+        return self.bgr.shape[0]
+
+    @property
+    def width(self):
+        return self.bgr.shape[1]
+
+    @property
+    def orig_width(self):
+        """Width of the upload itself (differs from `width` after a reduced decode)."""
+        return self._orig_size[0] if self._orig_size else self.width
+
+    @property
+    def orig_height(self):
+        return self._orig_size[1] if self._orig_size else self.height
+
+    # ------------------------------------------------------------------
+    #  Cached views
+    # ------------------------------------------------------------------
+
+    def cached(self, key, build):
+        """
+        Per-frame cache: build() runs once per key, later calls return its result.
+        Detectors use it to share derived data (views, tables) across a request.
+        """
+        view = self._views.get(key)
+        if view is None:
+            with self._lock:
+                view = self._views.get(key)
+                if view is None:
+                    view = build()
+                    self._views[key] = view
+        return view
+
+    @property
+    def rgb(self):
+        return self.cached("rgb", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    @property
+    def gray(self):
+        return self.cached("gray", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    def resized(self, max_dim):
+        """BGR view with the longer side capped at max_dim (never upscaled)."""
+        def build():
+            h, w = self.bgr.shape[:2]
+            if max(h, w) <= max_dim:
+                return self.bgr
+            scale = max_dim / max(h, w)
+            return cv2.resize(self.bgr, (int(w * scale), int(h * scale)))
+        return self.cached(("resized", max_dim), build)
+
+    def thumbnail(self, size):
+        """RGB view fitting inside size x size, aspect kept (like PIL's Image.thumbnail)."""
+        def build():
+            h, w = self.bgr.shape[:2]
+            scale = min(size / w, size / h, 1.0)
+            if scale >= 1.0:
+                return self.rgb
+            new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+            return cv2.resize(self.rgb, (new_w, new_h), interpolation=cv2.INTER_AREA)
+        return self.cached(("thumbnail", size), build)
+
+    def letterbox(self, target_w, target_h, fill=114):
+        """
+        RGB view scaled to fit target_w x target_h and padded with `fill`.
+        Returns (canvas, scale, pad_left, pad_top).
+        """
+        def build():
+            h, w = self.bgr.shape[:2]
+            scale = min(target_w / w, target_h / h)
+            new_w, new_h = int(round(w * scale)), int(round(h * scale))
+            pad_l, pad_t = (target_w - new_w) // 2, (target_h - new_h) // 2
+            resized = cv2.resize(self.rgb, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+            canvas = np.full((target_h, target_w, 3), fill, dtype=np.uint8)
+            canvas[pad_t:pad_t + new_h, pad_l:pad_l + new_w] = resized
+            return canvas, scale, pad_l, pad_t
+        return self.cached(("letterbox", target_w, target_h, fill), build)
+
+
+IMAGE_MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+
+def encode_image(bgr, fmt="jpeg", quality=80, max_dim=None):
+    """
+    BGR array -> (encoded bytes, media type).
+    fmt: "jpeg" | "webp" | "png"; max_dim optionally caps the longer side first.
+    """
+    fmt = fmt.lower().replace("jpg", "jpeg")
+    if fmt not in IMAGE_MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {fmt}")
+
+    if max_dim:
+        h, w = bgr.shape[:2]
+        if max(h, w) > max_dim:
+            scale = max_dim / max(h, w)
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+
+    params = {
+        "jpeg": [cv2.IMWRITE_JPEG_QUALITY, int(quality)],
+        "webp": [cv2.IMWRITE_WEBP_QUALITY, int(quality)],
+        "png": [cv2.IMWRITE_PNG_COMPRESSION, 1],
+    }[fmt]
+    ok, buf = cv2.imencode("." + fmt, bgr, params)
+    if not ok:
+        raise ValueError(f"Failed to encode image as {fmt}")
+    return buf.tobytes(), IMAGE_MEDIA_TYPES[fmt]
@@ -960,6 +960,7 @@ import traceback
 import base64
 import io
 import inspect
+import threading
 
 import cv2
 import numpy as np
@@ -968,14 +969,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from services import face_database, face_embedding, tts
+from services import face_database, face_embedding, face_gallery, inference_pool, micro_batcher, model_runtime, tts
 
 # Your modules
 from colour_detection import ColorDetector
-from currency_detection import CurrencyDetector  # colleague uses this too
+from currency_detection import CurrencyDetector, CurrencyConsensus  # colleague uses this too
 
 # Colleague object detection
-from object_detection import ObjectDetector, WANTED_COCO_CLASSES
+from object_detection import ObjectDetector, WANTED_COCO_CLASSES, configure_torch_threads
+
+# One decoded upload shared by every detector
+from frame import Frame, IMAGE_MEDIA_TYPES, encode_image
 
 
 # ================================================================
@@ -999,6 +1003,33 @@ async def log_requests(request: Request, call_next):
     return resp
 
 
+@app.on_event("startup")
+async def _configure_threads():
+    # one process-wide torch intra-op count, set before any model loads
+    configure_torch_threads()
+
+
+@app.on_event("startup")
+async def _warm_color_detector():
+    # a fresh deploy builds the colour-name LUT (several seconds): do it on the pool, not per request
+    try:
+        await _run_blocking("color", _get_color_detector)
+    except Exception:
+        traceback.print_exc()
+
+
+@app.on_event("startup")
+async def _load_face_gallery():
+    # One Mongo fetch per process; per-frame matching reads the in-memory matrix.
+    # Runs on the pool so a slow/down Mongo never blocks the event loop.
+    await _run_blocking("db", face_gallery.get_gallery().start)
+
+
+@app.on_event("shutdown")
+async def _stop_face_gallery():
+    face_gallery.get_gallery().stop()
+
+
 # ================================================================
 # Paths
 # ================================================================
@@ -1009,12 +1040,25 @@ _ASSETS_DIR = os.path.join(_BACKEND_DIR, "assets")
 _CUSTOM_MODEL_PATH = os.environ.get("CUSTOM_MODEL_PATH", os.path.join(_ASSETS_DIR, "washroom_kitchen_only.pt"))
 _COCO_MODEL_PATH   = os.environ.get("COCO_MODEL_PATH",   os.path.join(_ASSETS_DIR, "yolov8n.pt"))
 
+# "fp32" or "int8" (quantised variants built by quantize_models.py);
+# MobileFaceNet uses MOBILEFACENET_VARIANT in services/face_embedding.py
+_CUSTOM_MODEL_VARIANT  = os.environ.get("CUSTOM_MODEL_VARIANT",  "fp32").lower()
+_COCO_MODEL_VARIANT    = os.environ.get("COCO_MODEL_VARIANT",    "fp32").lower()
+_CLOTHES_MODEL_VARIANT = os.environ.get("CLOTHES_MODEL_VARIANT", "fp32").lower()
+
 # currency model
 _CURRENCY_MODEL_PATH = os.environ.get("CURRENCY_MODEL_PATH", os.path.join(_ASSETS_DIR, "yolo26-obb-tflite.tflite"))
 
 # YOUR clothes model for clothes+color
 _CLOTHES_MODEL_PATH = os.environ.get("CLOTHES_MODEL_PATH", os.path.join(_ASSETS_DIR, "clothes_best_v4.pt"))
 
+# model input sizes, used to pick a reduced-resolution JPEG decode
+_YOLO_INPUT_DIM = 640
+_NAV_MAX_DIM = 640
+
+# navigation face detection: "frame" (one MTCNN pass per frame) or "per_person" (one per person box)
+_FACE_DETECT_MODE = os.environ.get("FACE_DETECT_MODE", "frame").lower()
+
 
 # ================================================================
 # Pydantic Models
@@ -1064,6 +1108,147 @@ def estimate_distance(bbox: list, img_height: int, img_width: int) -> str:
     return "far"
 
 
+def _pad_box(box: Tuple[int, int, int, int], pad: int, img_w: int, img_h: int) -> Tuple[int, int, int, int]:
+    x1, y1, x2, y2 = box
+    return max(0, x1 - pad), max(0, y1 - pad), min(img_w - 1, x2 + pad), min(img_h - 1, y2 + pad)
+
+
+def _assign_faces_to_boxes(faces: List[dict], boxes: List[Tuple[int, int, int, int]]) -> List[List[dict]]:
+    """
+    Give every face to the person box that contains its centre.
+    With overlapping boxes the smallest one wins (the nearer/more specific person).
+    """
+    assigned: List[List[dict]] = [[] for _ in boxes]
+    if not faces or not boxes:
+        return assigned
+
+    b = np.asarray(boxes, dtype=np.float32)                          # (B, 4)
+    fb = np.asarray([f["bbox"] for f in faces], dtype=np.float32)    # (F, 4)
+    cx = ((fb[:, 0] + fb[:, 2]) / 2)[:, None]
+    cy = ((fb[:, 1] + fb[:, 3]) / 2)[:, None]
+
+    inside = (cx >= b[:, 0]) & (cx <= b[:, 2]) & (cy >= b[:, 1]) & (cy <= b[:, 3])  # (F, B)
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    owner = np.argmin(np.where(inside, areas[None, :], np.inf), axis=1)
+
+    for fi, bi in enumerate(owner):
+        if inside[fi, bi]:
+            assigned[bi].append(faces[fi])
+    return assigned
+
+
+def _detect_faces_in_boxes(image: np.ndarray, boxes: List[Tuple[int, int, int, int]]) -> List[List[dict]]:
+    """
+    Faces (absolute bbox) inside each person box.
+    "frame" mode: one MTCNN pass on the whole frame + geometric assignment.
+    "per_person" mode: one MTCNN pass per box crop (old behaviour).
+    """
+    if not boxes:
+        return []
+
+    if _FACE_DETECT_MODE == "frame":
+        return _assign_faces_to_boxes(face_embedding.detect_face_and_crop(image), boxes)
+
+    per_box: List[List[dict]] = []
+    for (x1, y1, x2, y2) in boxes:
+        crop = image[y1:y2, x1:x2]
+        faces = face_embedding.detect_face_and_crop(crop) if crop.size else []
+        for f in faces:
+            fx1, fy1, fx2, fy2 = f["bbox"]
+            f["bbox"] = [x1 + fx1, y1 + fy1, x1 + fx2, y1 + fy2]
+        per_box.append(faces)
+    return per_box
+
+
+def _match_faces(crops: List[np.ndarray], threshold: float = 0.6) -> List[Optional[Tuple[str, float]]]:
+    """
+    Gallery match for every face crop: one batched embedding pass, falling
+    back to face-by-face when the batch fails so one bad crop only loses its own match.
+    """
+    gallery = face_gallery.get_gallery()
+    try:
+        return gallery.match_many(face_embedding.generate_embeddings(crops), threshold=threshold)
+    except Exception:
+        traceback.print_exc()
+
+    matches: List[Optional[Tuple[str, float]]] = []
+    for crop in crops:
+        try:
+            matches.append(gallery.match(face_embedding.generate_embedding(crop), threshold=threshold))
+        except Exception:
+            traceback.print_exc()
+            matches.append(None)
+    return matches
+
+
+async def _read_frame(file: UploadFile, target_dim: Optional[int] = None) -> Frame:
+    """
+    Read an upload and decode it once (on the pool); 400 if empty or undecodable.
+    target_dim: largest side the consuming models need; big JPEGs are then
+    decoded at 1/2..1/8 resolution (detectors map coordinates back via frame.scale).
+    """
+    image_bytes = await file.read()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Empty file")
+
+    frame = Frame(image_bytes, target_dim=target_dim)
+    if await _run_blocking("decode", frame.decode) is None:
+        raise HTTPException(status_code=400, detail="Invalid image")
+    return frame
+
+
+async def _run_blocking(model: str, fn, *args, **kwargs):
+    """Run blocking inference/DB work on the bounded pool; 503 + Retry-After when saturated."""
+    try:
+        return await inference_pool.get_pool().run(model, fn, *args, **kwargs)
+    except inference_pool.PoolSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def _image_format(fmt: str) -> str:
+    """Normalise a requested image format; 400 if unsupported."""
+    fmt = (fmt or "").lower().replace("jpg", "jpeg")
+    if fmt not in IMAGE_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(IMAGE_MEDIA_TYPES)}")
+    return fmt
+
+
+def _image_quality(quality: int) -> int:
+    """JPEG/WebP quality; 400 outside 1-100 (cv2 would only clamp it with a warning)."""
+    if not 1 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality must be 1-100")
+    return quality
+
+
+def _preview_format(fmt: str, size: int, quality: int) -> str:
+    """Validate the preview_* parameters; returns the normalised format."""
+    if not 16 <= size <= 4096:
+        raise HTTPException(status_code=400, detail="preview_size must be 16-4096")
+    _image_quality(quality)
+    return _image_format(fmt)
+
+
+def _encode_preview(draw_fn, frame: Frame, result, fmt: str, max_dim: Optional[int], quality: int) -> dict:
+    """Draw `result` onto the frame and return it as a base64 JSON field."""
+    canvas = draw_fn(frame, result)
+    data, media_type = encode_image(canvas, fmt=fmt, quality=quality, max_dim=max_dim)
+    h, w = canvas.shape[:2]
+    if max_dim and max(h, w) > max_dim:
+        s = max_dim / max(h, w)
+        w, h = max(1, int(w * s)), max(1, int(h * s))
+    return {
+        "format": fmt,
+        "media_type": media_type,
+        "width": w,
+        "height": h,
+        "data": base64.b64encode(data).decode("ascii"),
+    }
+
+
 def _ensure_exists(path: str, label: str):
     if not os.path.exists(path):
         raise FileNotFoundError(f"{label} not found at: {path}\nExpected inside: {_ASSETS_DIR}")
@@ -1076,19 +1261,26 @@ _object_detector = None
 _color_detector = None
 _currency_detector = None
 _clothes_detector = None
+_currency_consensus = None
+# YOLO getters can export a model (tens of seconds): they run on the pool, one build at a time
+_yolo_load_lock = threading.Lock()
 
 
 def _get_object_detector():
     """Colleague: Dual-model ObjectDetector (custom washroom/kitchen + COCO)"""
     global _object_detector
     if _object_detector is None:
-        _ensure_exists(_CUSTOM_MODEL_PATH, "Custom model")
-        _ensure_exists(_COCO_MODEL_PATH, "COCO model")
-        print(f"[objects] Loading ObjectDetector (custom={_CUSTOM_MODEL_PATH}, coco={_COCO_MODEL_PATH})")
-        _object_detector = ObjectDetector(
-            custom_model_path=_CUSTOM_MODEL_PATH,
-            coco_model_path=_COCO_MODEL_PATH,
-        )
+        with _yolo_load_lock:
+            if _object_detector is None:
+                _ensure_exists(_CUSTOM_MODEL_PATH, "Custom model")
+                _ensure_exists(_COCO_MODEL_PATH, "COCO model")
+                print(f"[objects] Loading ObjectDetector (custom={_CUSTOM_MODEL_PATH}, coco={_COCO_MODEL_PATH})")
+                _object_detector = ObjectDetector(
+                    custom_model_path=_CUSTOM_MODEL_PATH,
+                    coco_model_path=_COCO_MODEL_PATH,
+                    custom_variant=_CUSTOM_MODEL_VARIANT,
+                    coco_variant=_COCO_MODEL_VARIANT,
+                )
     return _object_detector
 
 
@@ -1164,16 +1356,24 @@ def _get_currency_detector():
 
     return _currency_detector
 
+def _get_currency_consensus():
+    """Per-client multi-frame currency totals (session mode of /detect-currency)"""
+    global _currency_consensus
+    if _currency_consensus is None:
+        _currency_consensus = CurrencyConsensus()
+    return _currency_consensus
+
 def _get_clothes_detector():
     """YOLO clothes model for clothes+color endpoint: clothes_best_v4.pt"""
     global _clothes_detector
     if _clothes_detector is None:
-        _ensure_exists(_CLOTHES_MODEL_PATH, "Clothes model")
-        from ultralytics import YOLO
-        print(f"[clothes] Loading clothes YOLO from {_CLOTHES_MODEL_PATH}")
-        _clothes_detector = YOLO(_CLOTHES_MODEL_PATH)
-        print("[clothes] model names:", getattr(_clothes_detector, "names", None))
-        print("USING CLOTHES MODEL:", _CLOTHES_MODEL_PATH)
+        with _yolo_load_lock:
+            if _clothes_detector is None:
+                _ensure_exists(_CLOTHES_MODEL_PATH, "Clothes model")
+                print(f"[clothes] Loading clothes YOLO from {_CLOTHES_MODEL_PATH}")
+                _clothes_detector = model_runtime.load_yolo(_CLOTHES_MODEL_PATH, variant=_CLOTHES_MODEL_VARIANT)
+                print("[clothes] model names:", getattr(_clothes_detector, "names", None))
+                print("USING CLOTHES MODEL:", _CLOTHES_MODEL_PATH)
     print("MODEL NAMES:", _clothes_detector.names)
     return _clothes_detector
 
@@ -1197,6 +1397,7 @@ async def root():
             "currency_detection_annotated": "/detect-currency-annotated",
             "color_detection": "/detect-color",
             "color_detection_simple": "/detect-color-simple",
+            "color_map": "/detect-color-map",
 
             # IMPORTANT: your app calls this
             "clothes_with_color": "/detect-objects-with-color",
@@ -1205,6 +1406,9 @@ async def root():
             "person_register_base64": "/api/person/register",
             "person_register_files": "/register-person",
             "debug_persons": "/debug/persons",
+            "debug_face_index": "/debug/face-index",
+            "inference_metrics": "/metrics/inference",
+            "batching_metrics": "/metrics/batching",
             "classes": "/classes",
         },
     }
@@ -1227,6 +1431,28 @@ async def health_check():
             "currency_model_path": _CURRENCY_MODEL_PATH,
             "clothes_model_path": _CLOTHES_MODEL_PATH,
         },
+        "face_gallery": {
+            "persons": face_gallery.get_gallery().num_persons,
+            "embeddings": face_gallery.get_gallery().num_embeddings,
+        },
+    }
+
+
+@app.get("/metrics/inference")
+async def inference_metrics():
+    """Queue depth and wait times per model, for sizing the worker pool."""
+    stats = inference_pool.get_pool().snapshot()
+    if _currency_detector is not None and hasattr(_currency_detector, "interpreter_stats"):
+        stats["currency_interpreters"] = _currency_detector.interpreter_stats()
+    return stats
+
+
+@app.get("/metrics/batching")
+async def batching_metrics():
+    """Batch-size and queue-delay histograms of the YOLO micro-batchers."""
+    return {
+        "enabled": micro_batcher.batching_enabled(),
+        "batchers": micro_batcher.batcher_stats(),
     }
 
 
@@ -1236,7 +1462,7 @@ async def health_check():
 @app.get("/debug/persons")
 async def debug_get_persons():
     try:
-        db_persons = face_database.get_all_persons()
+        db_persons = await _run_blocking("db", face_database.get_all_persons)
         result = []
         for person in db_persons:
             embeddings_list = person.get("embeddings", [])
@@ -1261,6 +1487,8 @@ async def debug_get_persons():
 
         return {"success": True, "total_persons": len(db_persons), "persons": result}
 
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         return {
@@ -1270,6 +1498,20 @@ async def debug_get_persons():
         }
 
 
+@app.get("/debug/face-index")
+async def debug_face_index(k: int = 1, sample: int = 200):
+    """Search backend in use and its recall@k against exact search."""
+    if k < 1 or sample < 1:
+        raise HTTPException(status_code=400, detail="k and sample must be >= 1")
+    gallery = face_gallery.get_gallery()
+    return {
+        "success": True,
+        "persons": gallery.num_persons,
+        "embeddings": gallery.num_embeddings,
+        **gallery.recall(k=k, sample=sample),
+    }
+
+
 # ================================================================
 # API: Person Registration (JSON base64)
 # ================================================================
@@ -1284,31 +1526,35 @@ async def api_person_register(request: PersonRegisterRequest):
 
         print(f"[api_person_register] Registering '{name}' with {len(request.images)} images")
 
-        embeddings = []
+        face_crops = []
         for i, base64_str in enumerate(request.images):
-            image = decode_base64_image(base64_str)
+            image = await _run_blocking("decode", decode_base64_image, base64_str)
             if image is None:
                 print(f"[api_person_register] Image {i+1}: Could not decode")
                 continue
 
-            faces = face_embedding.detect_face_and_crop(image)
+            faces = await _run_blocking("face", face_embedding.detect_face_and_crop, image)
             if not faces:
                 print(f"[api_person_register] Image {i+1}: No faces detected")
                 continue
 
-            face_crop = faces[0]["crop"]
-            emb = face_embedding.generate_embedding(face_crop)
-            embeddings.append(emb.tolist())
-            print(f"[api_person_register] Image {i+1}: ✓ Extracted embedding")
+            face_crops.append(faces[0]["crop"])
+            print(f"[api_person_register] Image {i+1}: ✓ Face found")
+
+        # one batched forward pass for every enrolment image
+        embeddings = (await _run_blocking("face", face_embedding.generate_embeddings, face_crops)).tolist()
 
         if len(embeddings) == 0:
             return {"success": False, "error": "no_face_detected", "message": "Could not detect faces in any image"}
 
         try:
-            face_database.save_person_profile(name, embeddings)
+            await _run_blocking("db", face_database.save_person_profile, name, embeddings)
+            await _run_blocking("db", face_gallery.get_gallery().add_person, name, embeddings)
             return {"success": True, "name": name, "num_embeddings": len(embeddings), "message": f"Successfully registered {name}"}
         except face_database.DuplicateName:
             return {"success": False, "error": "duplicate_name", "message": f"Person '{name}' already exists"}
+        except HTTPException:
+            raise
         except Exception as db_error:
             traceback.print_exc()
             return {"success": False, "error": "database_error", "message": str(db_error)}
@@ -1334,34 +1580,34 @@ async def register_person(name: str, files: List[UploadFile] = File(...)):
         name = name.strip()
         print(f"[register] Starting registration for '{name}' with {len(files)} images")
 
-        embeddings = []
+        face_crops = []
         for i, f in enumerate(files):
             image_bytes = await f.read()
             if not image_bytes:
                 print(f"[register] Image {i+1}: Empty file, skipping")
                 continue
 
-            nparr = np.frombuffer(image_bytes, dtype=np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image = await _run_blocking("decode", Frame(image_bytes).decode)
             if image is None:
                 print(f"[register] Image {i+1}: Invalid image, skipping")
                 continue
 
-            faces = face_embedding.detect_face_and_crop(image)
+            faces = await _run_blocking("face", face_embedding.detect_face_and_crop, image)
             if not faces:
                 print(f"[register] Image {i+1}: No faces detected")
                 continue
 
-            face_crop = faces[0]["crop"]
-            emb = face_embedding.generate_embedding(face_crop)
-            embeddings.append(emb.tolist())
-            print(f"[register] Image {i+1}: ✓ Extracted embedding")
+            face_crops.append(faces[0]["crop"])
+            print(f"[register] Image {i+1}: ✓ Face found")
+
+        embeddings = (await _run_blocking("face", face_embedding.generate_embeddings, face_crops)).tolist()
 
         if len(embeddings) == 0:
             raise HTTPException(status_code=400, detail="Could not extract embeddings. Make sure faces are clearly visible.")
 
         try:
-            face_database.save_person_profile(name, embeddings)
+            await _run_blocking("db", face_database.save_person_profile, name, embeddings)
+            await _run_blocking("db", face_gallery.get_gallery().add_person, name, embeddings)
             return {"success": True, "name": name, "embeddings_count": len(embeddings)}
         except face_database.DuplicateName:
             raise HTTPException(status_code=400, detail=f"Person '{name}' already exists in database")
@@ -1381,42 +1627,20 @@ async def register_person(name: str, files: List[UploadFile] = File(...)):
 @app.post("/object-navigation-detect")
 async def object_navigation_detect(file: UploadFile = File(...), confidence: float = 0.5):
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
-
-        nparr = np.frombuffer(image_bytes, dtype=np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if image is None:
-            raise HTTPException(status_code=400, detail="Invalid image")
+        frame = await _read_frame(file, target_dim=_NAV_MAX_DIM)
 
-        # optional resize for speed
+        # optional resize for speed (longer side capped at 640)
+        image = await _run_blocking("decode", frame.resized, _NAV_MAX_DIM)
         h, w = image.shape[:2]
-        max_dim = 640
-        if max(h, w) > max_dim:
-            scale = max_dim / max(h, w)
-            image = cv2.resize(image, (int(w * scale), int(h * scale)))
-            h, w = image.shape[:2]
 
         detections: List[dict] = []
         persons_result: List[dict] = []
         tts_messages: List[str] = []
 
-        # Load DB persons once
-        try:
-            db_persons = face_database.get_all_persons()
-            print(f"[nav] Loaded {len(db_persons)} persons from DB")
-        except Exception:
-            traceback.print_exc()
-            db_persons = []
-
         # colleague object detection
-        detector = _get_object_detector()
-        ok, buf = cv2.imencode(".jpg", image)
-        if not ok:
-            raise HTTPException(status_code=500, detail="Failed to encode image")
-
-        det_result = detector.detect_objects(buf.tobytes(), conf_threshold=confidence)
+        detector = await _run_blocking("objects", _get_object_detector)
+        # pass the decoded frame straight through (no JPEG re-encode/decode)
+        det_result = await _run_blocking("objects", detector.detect_objects, image, conf_threshold=confidence)
         person_boxes: List[Tuple[int, int, int, int]] = []
 
         for d in det_result.get("detections", []):
@@ -1447,18 +1671,12 @@ async def object_navigation_detect(file: UploadFile = File(...), confidence: flo
                 person_boxes.append((x1, y1, x2, y2))
 
         # face recognition inside person boxes
-        for (px1, py1, px2, py2) in person_boxes:
-            pad = 20
-            x1 = max(0, px1 - pad)
-            y1 = max(0, py1 - pad)
-            x2 = min(w - 1, px2 + pad)
-            y2 = min(h - 1, py2 + pad)
-
-            person_crop = image[y1:y2, x1:x2]
-            if person_crop.size == 0:
-                continue
-
-            faces = face_embedding.detect_face_and_crop(person_crop)
+        padded_boxes = [_pad_box(b, 20, w, h) for b in person_boxes]
+        # empty crops were always skipped, in either face mode
+        padded_boxes = [(x1, y1, x2, y2) for x1, y1, x2, y2 in padded_boxes if x2 > x1 and y2 > y1]
+        face_entries: List[Tuple[int, np.ndarray]] = []  # (index into persons_result, face crop)
+        faces_per_box = await _run_blocking("face", _detect_faces_in_boxes, image, padded_boxes)
+        for (x1, y1, x2, y2), faces in zip(padded_boxes, faces_per_box):
             if not faces:
                 x_center = (x1 + x2) / 2
                 position = get_horizontal_position(x_center, w)
@@ -1473,32 +1691,28 @@ async def object_navigation_detect(file: UploadFile = File(...), confidence: flo
                 continue
 
             for f in faces:
-                crop = f["crop"]
-                fb = f["bbox"]
-                abs_bbox = [int(x1 + fb[0]), int(y1 + fb[1]), int(x1 + fb[2]), int(y1 + fb[3])]
-
-                label = "person"
-                similarity: Optional[float] = None
-                try:
-                    emb = face_embedding.generate_embedding(crop)
-                    match = face_embedding.compare_embedding_to_db(emb, db_persons, threshold=0.6)
-                    if match:
-                        label, similarity = match
-                except Exception:
-                    traceback.print_exc()
+                abs_bbox = f["bbox"]
 
                 x_center = (abs_bbox[0] + abs_bbox[2]) / 2
                 position = get_horizontal_position(x_center, w)
                 distance = estimate_distance(abs_bbox, h, w)
 
+                face_entries.append((len(persons_result), f["crop"]))
                 persons_result.append({
-                    "label": label,
+                    "label": "person",
                     "bbox": abs_bbox,
-                    "similarity": similarity,
+                    "similarity": None,
                     "position": position,
                     "distance": distance,
                 })
 
+        # match every face in the frame against the gallery in one go
+        if face_entries:
+            matches = await _run_blocking("face", _match_faces, [crop for _, crop in face_entries], 0.6)
+            for (idx, _), match in zip(face_entries, matches):
+                if match:
+                    persons_result[idx]["label"], persons_result[idx]["similarity"] = match
+
         for p in persons_result:
             position = p.get("position", "center")
             distance = p.get("distance", "medium")
@@ -1533,22 +1747,48 @@ async def object_navigation_detect(file: UploadFile = File(...), confidence: flo
 # MODE 2: Currency Detection (colleague)
 # ================================================================
 @app.post("/detect-currency")
-async def detect_currency(file: UploadFile = File(...), confidence: float = 0.25):
+async def detect_currency(
+    file: UploadFile = File(...),
+    confidence: float = 0.25,
+    preview: bool = False,
+    preview_size: int = _YOLO_INPUT_DIM,
+    preview_format: str = "jpeg",
+    preview_quality: int = 70,
+    session_id: Optional[str] = None,
+):
+    """
+    preview=true adds the annotated frame (base64) drawn from the same inference.
+    session_id fuses consecutive frames from one client; the total is then
+    only spoken once it is stable (and again only when it changes).
+    """
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
+        fmt = _preview_format(preview_format, preview_size, preview_quality) if preview else None
+        frame = await _read_frame(file, target_dim=_YOLO_INPUT_DIM)
 
         detector = _get_currency_detector()
 
         # robust call: support different method names
         if hasattr(detector, "detect_currency"):
-            results = detector.detect_currency(image_bytes, conf_threshold=confidence)
+            results = await _run_blocking("currency", detector.detect_currency, frame, conf_threshold=confidence)
         else:
             raise HTTPException(status_code=500, detail="CurrencyDetector missing detect_currency()")
 
         tts_msg = "No currency detected" if results.get("count", 0) == 0 else f"Total {results.get('total_amount', 0)} rupees"
-        return JSONResponse({"success": True, **results, "tts_message": tts_msg})
+        payload = {"success": True, **results, "tts_message": tts_msg}
+        if session_id:
+            session = _get_currency_consensus().update(session_id, results)
+            payload["session"] = session
+            if not session["announce"]:
+                payload["tts_message"] = None
+            elif not session["notes"]:
+                payload["tts_message"] = "No currency detected"
+            else:
+                payload["tts_message"] = f"Total {session['total_amount']} rupees"
+        if preview:
+            payload["preview"] = await _run_blocking(
+                "encode", _encode_preview, detector.draw_detections, frame, results, fmt, preview_size, preview_quality
+            )
+        return JSONResponse(payload)
 
     except HTTPException:
         raise
@@ -1560,14 +1800,13 @@ async def detect_currency(file: UploadFile = File(...), confidence: float = 0.25
 @app.post("/detect-currency-annotated")
 async def detect_currency_annotated(file: UploadFile = File(...), confidence: float = 0.25):
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
+        # full-resolution decode: boxes are drawn in upload coordinates
+        frame = await _read_frame(file)
 
         detector = _get_currency_detector()
 
         if hasattr(detector, "detect_and_draw"):
-            annotated = detector.detect_and_draw(image_bytes, conf_threshold=confidence)
+            annotated = await _run_blocking("currency", detector.detect_and_draw, frame, conf_threshold=confidence)
         else:
             raise HTTPException(status_code=500, detail="CurrencyDetector missing detect_and_draw()")
 
@@ -1584,14 +1823,16 @@ async def detect_currency_annotated(file: UploadFile = File(...), confidence: fl
 # MODE 3: Color Detection (your code)
 # ================================================================
 @app.post("/detect-color")
-async def detect_color(file: UploadFile = File(...)):
+async def detect_color(file: UploadFile = File(...), engine: Optional[str] = None):
+    """engine: kmeans | fast_kmeans | histogram | median_cut (default: COLOR_ENGINE)"""
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
+        if engine is not None and engine.lower() not in ColorDetector.ENGINES:
+            raise HTTPException(status_code=400, detail=f"engine must be one of {list(ColorDetector.ENGINES)}")
+
+        frame = await _read_frame(file, target_dim=300)
 
         detector = _get_color_detector()
-        result = detector.detect_color(image_bytes, n_colors=3)
+        result = await _run_blocking("color", detector.detect_color, frame, n_colors=3, engine=engine)
 
         primary = result.get("primary_color")
         tts_msg = f"Dominant color is {primary.get('name')}" if primary else "No color detected"
@@ -1608,12 +1849,10 @@ async def detect_color(file: UploadFile = File(...)):
 @app.post("/detect-color-simple")
 async def detect_color_simple(file: UploadFile = File(...)):
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
+        frame = await _read_frame(file, target_dim=100)
 
         detector = _get_color_detector()
-        result = detector.detect_color_simple(image_bytes)
+        result = await _run_blocking("color", detector.detect_color_simple, frame)
 
         return {"success": True, "mode": "color_detection_simple", "data": result, "tts_message": result.get("description")}
 
@@ -1624,20 +1863,62 @@ async def detect_color_simple(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/detect-color-map")
+async def detect_color_map(
+    file: UploadFile = File(...),
+    size: int = 150,
+    top: int = 8,
+    masks: bool = False,
+    grid: int = 8,
+):
+    """Every pixel named via the colour LUT: area fractions, locations and optional coarse masks."""
+    try:
+        detector = _get_color_detector()
+        if not (16 <= size <= 512 and 1 <= grid <= 32 and 1 <= top <= detector.num_color_names):
+            raise HTTPException(
+                status_code=400,
+                detail=f"size must be 16-512, grid 1-32 and top 1-{detector.num_color_names}",
+            )
+
+        frame = await _read_frame(file, target_dim=size)
+
+        result = await _run_blocking("color", detector.detect_color_map, frame, size=size, top=top, masks=masks, grid=grid)
+
+        return {"success": True, "mode": "color_map", "data": result, "tts_message": result.get("description")}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ================================================================
 # MODE 4: Object Detection (colleague dual-model)
 # ================================================================
 @app.post("/detect-objects")
-async def detect_objects(file: UploadFile = File(...), confidence: float = 0.25):
+async def detect_objects(
+    file: UploadFile = File(...),
+    confidence: float = 0.25,
+    preview: bool = False,
+    preview_size: int = _YOLO_INPUT_DIM,
+    preview_format: str = "jpeg",
+    preview_quality: int = 70,
+):
+    """preview=true adds the annotated frame (base64) drawn from the same inference."""
     try:
-        contents = await file.read()
-        if not contents:
-            raise HTTPException(status_code=400, detail="Empty file")
+        fmt = _preview_format(preview_format, preview_size, preview_quality) if preview else None
+        frame = await _read_frame(file, target_dim=_YOLO_INPUT_DIM)
 
-        detector = _get_object_detector()
-        results = detector.detect_objects(contents, conf_threshold=confidence)
+        detector = await _run_blocking("objects", _get_object_detector)
+        results = await _run_blocking("objects", detector.detect_objects, frame, conf_threshold=confidence)
 
-        return JSONResponse({"success": True, **results})
+        payload = {"success": True, **results}
+        if preview:
+            payload["preview"] = await _run_blocking(
+                "encode", _encode_preview, detector.draw_detections, frame, results, fmt, preview_size, preview_quality
+            )
+        return JSONResponse(payload)
 
     except HTTPException:
         raise
@@ -1647,16 +1928,19 @@ async def detect_objects(file: UploadFile = File(...), confidence: float = 0.25)
 
 
 @app.post("/detect-objects-annotated")
-async def detect_objects_annotated(file: UploadFile = File(...), confidence: float = 0.25):
+async def detect_objects_annotated(file: UploadFile = File(...), confidence: float = 0.25, format: str = "jpeg", quality: int = 80):
     try:
-        contents = await file.read()
-        if not contents:
-            raise HTTPException(status_code=400, detail="Empty file")
+        fmt = _image_format(format)
+        quality = _image_quality(quality)
 
-        detector = _get_object_detector()
-        annotated = detector.detect_and_draw(contents, conf_threshold=confidence)
+        # full-resolution decode: the annotated image is returned at upload size
+        frame = await _read_frame(file)
 
-        return StreamingResponse(io.BytesIO(annotated), media_type="image/png")
+        detector = await _run_blocking("objects", _get_object_detector)
+        annotated = await _run_blocking("objects", detector.detect_and_draw, frame,
+                                        conf_threshold=confidence, fmt=fmt, quality=quality)
+
+        return StreamingResponse(io.BytesIO(annotated), media_type=IMAGE_MEDIA_TYPES[fmt])
 
     except HTTPException:
         raise
@@ -1671,21 +1955,24 @@ async def detect_objects_annotated(file: UploadFile = File(...), confidence: flo
 # Uses clothes_best_v4.pt + your ColorDetector on crops
 # ================================================================
 @app.post("/detect-objects-with-color")
-async def detect_objects_with_color(file: UploadFile = File(...), confidence: float = 0.25):
+async def detect_objects_with_color(
+    file: UploadFile = File(...),
+    confidence: float = 0.25,
+    preview: bool = False,
+    preview_size: int = _YOLO_INPUT_DIM,
+    preview_format: str = "jpeg",
+    preview_quality: int = 70,
+):
     """
     Clothing + Color:
     - detect clothing using clothes_best_v4.pt
     - compute color per clothing item using your ColorDetector on bbox crop
+    - preview=true adds the annotated frame (base64) drawn from the same inference
     """
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="Empty file")
-
-        nparr = np.frombuffer(image_bytes, dtype=np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if image is None:
-            raise HTTPException(status_code=400, detail="Invalid image")
+        fmt = _preview_format(preview_format, preview_size, preview_quality) if preview else None
+        frame = await _read_frame(file)
+        image = frame.bgr
 
         h, w = image.shape[:2]
 
@@ -1768,9 +2055,11 @@ async def detect_objects_with_color(file: UploadFile = File(...), confidence: fl
                 return x1, y1, x2, y2
             return cx1, cy1, cx2, cy2
 
-        clothes_model = _get_clothes_detector()
+        clothes_model = await _run_blocking("clothes", _get_clothes_detector)
         effective_conf = max(float(confidence), 0.25)
-        results = clothes_model.predict(
+        results = await _run_blocking(
+            "clothes",
+            clothes_model.predict,
             image,
             conf=effective_conf,
             iou=0.45,
@@ -1788,6 +2077,7 @@ async def detect_objects_with_color(file: UploadFile = File(...), confidence: fl
 
         color_detector = _get_color_detector()
         detections = []
+        color_boxes = []  # (detection index, inner crop) of every box large enough to colour
 
         for res in results:
             for box in res.boxes:
@@ -1814,28 +2104,31 @@ async def detect_objects_with_color(file: UploadFile = File(...), confidence: fl
                     continue
 
                 cx1, cy1, cx2, cy2 = _inner_crop_coords(x1, y1, x2, y2)
-                crop = image[cy1:cy2, cx1:cx2]
-                if crop.size == 0:
+                if cx2 <= cx1 or cy2 <= cy1:
                     continue
 
                 # skip tiny crops
-                if (cx2 - cx1) * (cy2 - cy1) < 32 * 32:
-                    color_result = {"name": "Unknown", "hex": None, "description": None}
-                else:
-                    ok, buf = cv2.imencode(".jpg", crop)
-                    color_result = color_detector.detect_color_simple(buf.tobytes()) if ok else {"name": "Unknown"}
-
-                color_name = color_result.get("name") or color_result.get("color_name") or "Unknown"
+                if (cx2 - cx1) * (cy2 - cy1) >= 32 * 32:
+                    color_boxes.append((len(detections), (cx1, cy1, cx2, cy2)))
 
                 detections.append({
                     "class_name": cls_name,
                     "class_id": cls_id,
                     "confidence": confv,
                     "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
-                    "color": {"name": color_name, "hex": color_result.get("hex"), "raw": color_result},
+                    "color": {"name": "Unknown", "hex": None, "raw": {"name": "Unknown", "hex": None, "description": None}},
                     "_y_center": (y1 + y2) / 2.0,
                 })
 
+        # every box coloured in one pass over the frame (no per-crop copies)
+        if color_boxes:
+            color_results = await _run_blocking(
+                "color", color_detector.detect_box_colors, frame, [b for _, b in color_boxes]
+            )
+            for (i, _), color_result in zip(color_boxes, color_results):
+                color_name = color_result.get("name") or "Unknown"
+                detections[i]["color"] = {"name": color_name, "hex": color_result.get("hex"), "raw": color_result}
+
         detections = _dedupe_same_class(detections)
         detections = _apply_dupatta_shalwar_rules(detections, h)
         detections.sort(key=lambda d: d["confidence"], reverse=True)
@@ -1843,13 +2136,22 @@ async def detect_objects_with_color(file: UploadFile = File(...), confidence: fl
             d.pop("_y_center", None)
         tts_messages = [f"{d['color']['name']} {d['class_name']}" for d in detections[:3]]
 
-        return {
+        payload = {
             "success": True,
             "mode": "clothes_with_color",
             "count": len(detections),
             "detections": detections,
             "tts_messages": tts_messages,
         }
+        if preview:
+            labelled = {"detections": [
+                {"class": f"{d['color']['name']} {d['class_name']}", "confidence": d["confidence"], "bbox": d["bbox"]}
+                for d in detections
+            ]}
+            payload["preview"] = await _run_blocking(
+                "encode", _encode_preview, ObjectDetector.draw_detections, frame, labelled, fmt, preview_size, preview_quality
+            )
+        return payload
 
     except HTTPException:
         raise
@@ -1863,7 +2165,7 @@ async def detect_objects_with_color(file: UploadFile = File(...), confidence: fl
 # ================================================================
 @app.get("/classes")
 async def get_classes():
-    detector = _get_object_detector()
+    detector = await _run_blocking("objects", _get_object_detector)
     currency = _get_currency_detector()
 
     currency_classes = []
@@ -132,10 +132,16 @@
 #     "table": 3,
 # }
 
-from ultralytics import YOLO
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import cv2
 import numpy as np
-from PIL import Image
-import io
+import torch
+
+from frame import Frame, encode_image
+from services.micro_batcher import MicroBatcher, batching_enabled
+from services.model_runtime import load_yolo
 
 WANTED_COCO_CLASSES = {
     0: 'person',
@@ -182,45 +188,115 @@ PRIORITY_MAP = {
     "table": 3,
 }
 
+# Run the custom and COCO models concurrently, each on its own worker thread.
+# torch.set_num_threads is process-wide: OBJECT_DETECTOR_THREADS is the one
+# intra-op thread count shared by every torch model in the process (both YOLOs,
+# MTCNN, MobileFaceNet, clothes), applied once at startup. Default when running
+# in parallel: half the cores, so the two concurrent predicts together fill the box.
+OBJECT_DETECTOR_PARALLEL = os.environ.get("OBJECT_DETECTOR_PARALLEL", "1") != "0"
+OBJECT_DETECTOR_THREADS = os.environ.get("OBJECT_DETECTOR_THREADS", "")
+
+
+def torch_thread_count(spec=OBJECT_DETECTOR_THREADS):
+    """Process-wide torch intra-op thread count, or None to keep torch's default."""
+    default = max(1, (os.cpu_count() or 2) // 2) if OBJECT_DETECTOR_PARALLEL else None
+    if not spec.strip():
+        return default
+    try:
+        return max(1, int(spec))
+    except ValueError:
+        print(f"[objects] WARNING invalid OBJECT_DETECTOR_THREADS={spec!r}; using {default or 'torch default'}")
+        return default
+
+
+def configure_torch_threads():
+    """Apply torch_thread_count() once, before any model runs."""
+    num_threads = torch_thread_count()
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+        print(f"[objects] torch intra-op threads: {num_threads} (process-wide)")
+
 class ObjectDetector:
     def __init__(self,
                  custom_model_path='assets/washroom_kitchen_only.pt',
-                 coco_model_path='assets/yolov8n.pt'):
+                 coco_model_path='assets/yolov8n.pt',
+                 custom_variant='fp32',
+                 coco_variant='fp32'):
 
         """Initialize YOLOv8 object detector with COCO pretrained model"""
-        self.custom_model = YOLO(custom_model_path)
-        self.coco_model = YOLO(coco_model_path)
+        # PyTorch, ONNX Runtime or OpenVINO depending on YOLO_RUNTIME
+        # (variant="int8" serves the quantised ONNX model built by quantize_models.py)
+        self.custom_model = load_yolo(custom_model_path, variant=custom_variant)
+        self.coco_model = load_yolo(coco_model_path, variant=coco_variant)
 
         self.custom_classes = self.custom_model.names
         self.coco_classes = self.coco_model.names
 
-    def detect_objects(self, image_bytes, conf_threshold=0.25):
+        # Optional cross-request micro-batching (YOLO_BATCH_WINDOW_MS > 0)
+        self._custom_batcher = None
+        self._coco_batcher = None
+        if batching_enabled():
+            self._custom_batcher = MicroBatcher("custom", lambda imgs, conf: self.custom_model(imgs, conf=conf))
+            self._coco_batcher = MicroBatcher("coco", lambda imgs, conf: self.coco_model(imgs, conf=conf))
+
+        # Without batching, each model gets one worker thread so the two run concurrently.
+        # (Batchers already run each model on its own thread; callers enqueue into both.)
+        self._custom_executor = None
+        self._coco_executor = None
+        if OBJECT_DETECTOR_PARALLEL and self._custom_batcher is None:
+            self._custom_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-custom")
+            self._coco_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-coco")
+
+    def _predict(self, model, batcher, image_np, conf_threshold):
+        """Single-frame results, either directly or through the model's micro-batcher."""
+        if batcher is None:
+            return model(image_np, conf=conf_threshold)
+        return [batcher.submit(image_np, conf_threshold)]
+
+    def _predict_both(self, image_np, conf_threshold):
+        """(custom_results, coco_results) on the same clean frame, concurrently when enabled."""
+        if self._custom_batcher is not None and OBJECT_DETECTOR_PARALLEL:
+            # queue into both batchers from this thread, so concurrent requests share batches
+            custom = self._custom_batcher.enqueue(image_np, conf_threshold)
+            coco = self._coco_batcher.enqueue(image_np, conf_threshold)
+            return [custom.wait()], [coco.wait()]
+        if self._custom_executor is None:
+            return (
+                self._predict(self.custom_model, self._custom_batcher, image_np, conf_threshold),
+                self._predict(self.coco_model, self._coco_batcher, image_np, conf_threshold),
+            )
+        custom = self._custom_executor.submit(self._predict, self.custom_model, self._custom_batcher, image_np, conf_threshold)
+        coco = self._coco_executor.submit(self._predict, self.coco_model, self._coco_batcher, image_np, conf_threshold)
+        return custom.result(), coco.result()
+
+    def detect_objects(self, image, conf_threshold=0.25):
         """
         Detect objects in an image
         
         Args:
-            image_bytes: Image as bytes
+            image: Frame, image bytes, or an already-decoded BGR ndarray (OpenCV order)
             conf_threshold: Confidence threshold for detections (0-1)
             
         Returns:
             dict: Detection results with bounding boxes, classes, and confidences
         """
-        # Convert bytes to PIL Image
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert PIL to numpy array
-        image_np = np.array(image)
+        frame = Frame.coerce(image)
+        image_np = frame.bgr
         
         detections = []
-        image_width, image_height = image.width, image.height
+        image_height, image_width = image_np.shape[:2]
         image_area = image_width * image_height
 
-        # Run custom model
-        custom_results = self.custom_model(image_np, conf=conf_threshold)
+        # Run both models, merge only at the end
+        custom_results, coco_results = self._predict_both(image_np, conf_threshold)
+
         for result in custom_results:
             for box in result.boxes:
                 x1, y1, x2, y2 = box.xyxy[0].tolist()
                 confidence = float(box.conf[0])
+                if confidence < conf_threshold:
+                    # batched predicts run at the lowest threshold in the batch
+                    continue
                 class_id = int(box.cls[0])
                 class_name = self.custom_classes[class_id]
 
@@ -236,8 +312,6 @@ class ObjectDetector:
                     "priority": PRIORITY_MAP.get(class_name, 4)
                 })
 
-        # Run COCO model
-        coco_results = self.coco_model(image_np, conf=conf_threshold)
         for result in coco_results:
             for box in result.boxes:
                 class_id = int(box.cls[0])
@@ -245,6 +319,8 @@ class ObjectDetector:
                     continue
                 x1, y1, x2, y2 = box.xyxy[0].tolist()
                 confidence = float(box.conf[0])
+                if confidence < conf_threshold:
+                    continue
                 class_name = self.coco_classes[class_id]
 
                 x_center = (x1 + x2) / 2
@@ -259,6 +335,11 @@ class ObjectDetector:
                     "priority": PRIORITY_MAP.get(class_name, 4)
                 })
 
+        # map back to upload coordinates after a reduced-resolution decode
+        if frame.scale != 1.0:
+            for d in detections:
+                d["bbox"] = {k: v * frame.scale for k, v in d["bbox"].items()}
+
         # sort detections by priority before returning
         detections.sort(key=lambda d: d["priority"])
 
@@ -266,53 +347,87 @@ class ObjectDetector:
             'detections': detections,
             'count': len(detections),
             'image_size': {
-                'width': image.width,
-                'height': image.height
+                'width': frame.orig_width,
+                'height': frame.orig_height
             }
         }
     
-    def detect_and_draw(self, image_bytes, conf_threshold=0.25):
+    def detect_and_draw(self, image, conf_threshold=0.25, fmt="jpeg", quality=80):
         """
         Detect objects and return annotated image
         
         Args:
-            image_bytes: Image as bytes
+            image: Frame, image bytes, or an already-decoded BGR ndarray (OpenCV order)
             conf_threshold: Confidence threshold for detections
+            fmt: Output encoding ("jpeg", "webp" or "png")
+            quality: JPEG/WebP quality (1-100)
             
         Returns:
             bytes: Annotated image as bytes
         """
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        image_np = np.array(image)
+        frame = Frame.coerce(image)
 
-        # Run custom model and draw
-        custom_results = self.custom_model(image_np, conf=conf_threshold)
-        annotated_img = custom_results[0].plot() if len(custom_results) > 0 else image_np
+        # Same single inference as /detect-objects, on the clean frame
+        result = self.detect_objects(frame, conf_threshold=conf_threshold)
+        annotated_img = self.draw_detections(frame, result)
 
-        # Run COCO model and draw on top
-        from ultralytics.utils.plotting import Annotator
-        coco_results = self.coco_model(annotated_img, conf=conf_threshold)
-        annotator = Annotator(annotated_img)
-        for result in coco_results:
-            for box in result.boxes:
-                class_id = int(box.cls[0])
-                if class_id not in WANTED_COCO_CLASSES:
-                    continue
-                xyxy = box.xyxy[0].tolist()
-                conf = float(box.conf[0])
-                label = f"{WANTED_COCO_CLASSES[class_id]} {conf:.2f}"
-                annotator.box_label(xyxy, label)
-        annotated_img = annotator.result()
-
-        # Convert back to bytes
-        annotated_pil = Image.fromarray(annotated_img)
-        img_byte_arr = io.BytesIO()
-        annotated_pil.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
-        return img_byte_arr.getvalue()
+        return encode_image(annotated_img, fmt=fmt, quality=quality)[0]
+
+    @staticmethod
+    def draw_detections(image, result):
+        """
+        Draw a detect_objects() result onto a copy of the frame in one pass.
+
+        Boxes are grouped by colour and drawn with a single polylines call
+        per colour; labels are a filled rectangle plus text.
+        """
+        frame = Frame.coerce(image)
+        canvas = frame.bgr.copy()
+        detections = result["detections"]
+        if not detections:
+            return canvas
+
+        # bboxes are in upload coordinates; map back onto the decoded frame
+        boxes = np.array([[d["bbox"]["x1"], d["bbox"]["y1"], d["bbox"]["x2"], d["bbox"]["y2"]]
+                          for d in detections], dtype=np.float32)
+        boxes = np.rint(boxes / frame.scale).astype(np.int32)
+        colors = np.array([_color_index(d["class"]) for d in detections])
+
+        thickness = max(1, round(sum(canvas.shape[:2]) / 2 * 0.003))
+        font_scale = max(0.4, thickness / 3)
+
+        x1, y1, x2, y2 = boxes.T
+        corners = np.stack([
+            np.stack([x1, y1], axis=1),
+            np.stack([x2, y1], axis=1),
+            np.stack([x2, y2], axis=1),
+            np.stack([x1, y2], axis=1),
+        ], axis=1)  # (N, 4, 2)
+        for c in np.unique(colors):
+            cv2.polylines(canvas, list(corners[colors == c]), True, _PALETTE[c], thickness, cv2.LINE_AA)
+
+        for d, (bx1, by1, _, _), c in zip(detections, boxes, colors):
+            label = f"{d['class']} {d['confidence']:.2f}"
+            (tw, th), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+            top = by1 - th - baseline if by1 - th - baseline >= 0 else by1
+            cv2.rectangle(canvas, (int(bx1), int(top)), (int(bx1) + tw, int(top) + th + baseline), _PALETTE[c], -1)
+            cv2.putText(canvas, label, (int(bx1), int(top) + th), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, (255, 255, 255), 1, cv2.LINE_AA)
+        return canvas
     
 
+# BGR colours for annotation, picked per class name so a class keeps its colour
+_PALETTE = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+    (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+]
+
+
+def _color_index(class_name):
+    return sum(class_name.encode("utf-8")) % len(_PALETTE)
+
+
 def horizontal_position(x_center, img_width):
     if x_center < img_width * 0.33:
         return "left"
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+INT8 post-training quantisation for V-EYE's CPU models
+================================================
+
+Calibrates on a folder of sample frames and writes INT8 variants next to the
+FP32 models:
+
+    <model>.int8.onnx            YOLO (custom, COCO, clothes) - ONNX Runtime QDQ
+    model_mobilefacenet.int8.pt  MobileFaceNet - FX static quantisation, TorchScript
+
+then reports drift against FP32 on --eval frames (defaults to the calibration
+set): pseudo-mAP@0.5 and box recall/precision with FP32 boxes as ground truth
+for YOLO, cosine similarity of embeddings for MobileFaceNet, plus ms/frame.
+
+Serve the results with CUSTOM_MODEL_VARIANT / COCO_MODEL_VARIANT /
+CLOTHES_MODEL_VARIANT / MOBILEFACENET_VARIANT=int8.
+
+Usage:
+    python quantize_models.py --calib samples/
+    python quantize_models.py --calib samples/ --eval holdout/ --skip-face
+
+Frames with no detectable face are used as face crops as-is, so a folder of
+pre-cropped faces works for MobileFaceNet calibration too.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from frame import Frame
+from services import face_embedding, model_runtime
+
+
+_ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+DEFAULT_MODELS = [
+    os.environ.get("CUSTOM_MODEL_PATH", os.path.join(_ASSETS_DIR, "washroom_kitchen_only.pt")),
+    os.environ.get("COCO_MODEL_PATH", os.path.join(_ASSETS_DIR, "yolov8n.pt")),
+    os.environ.get("CLOTHES_MODEL_PATH", os.path.join(_ASSETS_DIR, "clothes_best_v4.pt")),
+]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_frames(folder, limit=None):
+    frames = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(folder, name), "rb") as f:
+            frame = Frame(f.read())
+        if frame.decode() is not None:
+            frames.append(frame)
+        if limit and len(frames) >= limit:
+            break
+    return frames
+
+
+# ================================================================
+# YOLO (ONNX Runtime static quantisation)
+# ================================================================
+def _yolo_calibration_reader(onnx_path, frames):
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader
+
+    session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    inp = session.get_inputs()[0]
+    h, w = inp.shape[2:]
+    h = h if isinstance(h, int) else model_runtime.YOLO_IMGSZ
+    w = w if isinstance(w, int) else model_runtime.YOLO_IMGSZ
+
+    class FrameReader(CalibrationDataReader):
+        """Letterboxed RGB frames, the same preprocessing ultralytics applies."""
+        def __init__(self):
+            self._frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            if frame is None:
+                return None
+            canvas = frame.letterbox(w, h)[0]
+            x = canvas.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            return {inp.name: x}
+
+    return FrameReader()
+
+
+def quantize_yolo(pt_path, calib_frames):
+    import onnx
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    fp32_onnx = model_runtime.export_yolo(pt_path, "onnx")
+    out_path = model_runtime.int8_path(pt_path)
+
+    quantize_static(
+        fp32_onnx,
+        out_path,
+        _yolo_calibration_reader(fp32_onnx, calib_frames),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+    # ultralytics reads class names / stride / task from the ONNX metadata
+    src, dst = onnx.load(fp32_onnx), onnx.load(out_path)
+    del dst.metadata_props[:]
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, out_path)
+    return out_path
+
+
+def evaluate_yolo(pt_path, int8_path, frames, conf):
+    from ultralytics import YOLO
+
+    def run(model):
+        started = time.perf_counter()
+        results = [model(f.bgr, conf=conf, verbose=False)[0] for f in frames]
+        return results, (time.perf_counter() - started) / len(frames) * 1000
+
+    reference, ref_ms = run(YOLO(pt_path))
+    candidate, int8_ms = run(YOLO(int8_path, task="detect"))
+
+    report = model_runtime.summarize([model_runtime.compare_results(r, c) for r, c in zip(reference, candidate)])
+    report.update({
+        "model": os.path.basename(pt_path),
+        "pseudo_map50": model_runtime.pseudo_map50(reference, candidate),
+        "fp32_ms_per_frame": round(ref_ms, 2),
+        "int8_ms_per_frame": round(int8_ms, 2),
+    })
+    return report
+
+
+# ================================================================
+# MobileFaceNet (FX graph-mode static quantisation)
+# ================================================================
+def face_crops(frames):
+    crops = []
+    for frame in frames:
+        faces = face_embedding.detect_face_and_crop(frame.bgr)
+        if faces:
+            crops.extend(f["crop"] for f in faces)
+        else:
+            crops.append(frame.bgr)
+    return crops
+
+
+def quantize_mobilefacenet(calib_crops, batch_size=32):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = "x86"
+    model = face_embedding.load_mobilefacenet("fp32")
+    example = torch.zeros(1, 3, face_embedding._INPUT_SIZE, face_embedding._INPUT_SIZE)
+
+    prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (example,))
+    with torch.no_grad():
+        for i in range(0, len(calib_crops), batch_size):
+            prepared(face_embedding._preprocess_crops(calib_crops[i:i + batch_size]))
+    quantized = convert_fx(prepared)
+
+    out_path = face_embedding._MOBILEFACENET_INT8_PATH
+    with torch.no_grad():
+        torch.jit.save(torch.jit.trace(quantized, example), out_path)
+    return out_path
+
+
+def evaluate_mobilefacenet(crops):
+    x = face_embedding._preprocess_crops(crops)
+
+    def run(model):
+        with torch.inference_mode():
+            model(x[:1])  # warm-up (TorchScript profiling run)
+            started = time.perf_counter()
+            embs = model(x).numpy()
+        return face_embedding.normalize_embeddings(embs), (time.perf_counter() - started) / len(crops) * 1000
+
+    fp32, fp32_ms = run(face_embedding.load_mobilefacenet("fp32"))
+    int8, int8_ms = run(face_embedding.load_mobilefacenet("int8"))
+    cos = np.sum(fp32 * int8, axis=1)
+    return {
+        "model": "mobilefacenet",
+        "crops": len(crops),
+        "cosine_mean": float(cos.mean()),
+        "cosine_min": float(cos.min()),
+        "fp32_ms_per_crop": round(fp32_ms, 3),
+        "int8_ms_per_crop": round(int8_ms, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build INT8 variants of the V-EYE CPU models")
+    parser.add_argument("--calib", required=True, help="folder of representative frames")
+    parser.add_argument("--eval", help="folder of frames for the drift report (default: --calib)")
+    parser.add_argument("--max-calib", type=int, default=200)
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS, help="YOLO checkpoints (.pt)")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--skip-yolo", action="store_true")
+    parser.add_argument("--skip-face", action="store_true")
+    args = parser.parse_args()
+
+    calib = load_frames(args.calib, args.max_calib)
+    evaluation = load_frames(args.eval) if args.eval else calib
+    if not calib or not evaluation:
+        print("No calibration/evaluation images found")
+        sys.exit(1)
+    print(f"[quant] {len(calib)} calibration frames, {len(evaluation)} evaluation frames")
+
+    reports = []
+    if not args.skip_yolo:
+        for pt_path in args.models:
+            if not os.path.exists(pt_path):
+                print(f"[skip] {pt_path} not found")
+                continue
+            out_path = quantize_yolo(pt_path, calib)
+            print(f"[ok] {os.path.basename(pt_path)} -> {out_path}")
+            reports.append(evaluate_yolo(pt_path, out_path, evaluation, args.conf))
+
+    if not args.skip_face:
+        out_path = quantize_mobilefacenet(face_crops(calib))
+        print(f"[ok] mobilefacenet -> {out_path}")
+        reports.append(evaluate_mobilefacenet(face_crops(evaluation)))
+
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
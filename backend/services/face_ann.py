@@ -0,0 +1,234 @@
+# backend/services/face_ann.py
+"""
+Pluggable nearest-neighbour search over the face gallery matrix.
+
+FACE_SEARCH_BACKEND selects the implementation:
+- "exact" (default): dense matmul over every gallery row
+- "hnsw": approximate HNSW graph (hnswlib, CPU-only), persisted to
+  FACE_ANN_INDEX_PATH next to the other assets and extended in place on
+  registration.
+
+Both return row ids into the gallery matrix, so names/aggregation stay in
+face_gallery / face_embedding.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except Exception:
+    hnswlib = None
+
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # .../backend
+_ASSETS_DIR = os.path.join(_BACKEND_DIR, "assets")
+
+_SEARCH_BACKEND = os.environ.get("FACE_SEARCH_BACKEND", "exact").lower()
+_INDEX_PATH = os.environ.get("FACE_ANN_INDEX_PATH", os.path.join(_ASSETS_DIR, "face_index.hnsw"))
+
+# HNSW parameters (see hnswlib docs): graph degree, build / query beam width
+_HNSW_M = int(os.environ.get("FACE_HNSW_M", "16"))
+_HNSW_EF_CONSTRUCTION = int(os.environ.get("FACE_HNSW_EF_CONSTRUCTION", "200"))
+_HNSW_EF_SEARCH = int(os.environ.get("FACE_HNSW_EF_SEARCH", "64"))
+
+
+def gallery_digest(names: np.ndarray, matrix: np.ndarray) -> str:
+    """Identifies which rows an index was built from (names, vectors and row order)."""
+    h = hashlib.sha1()
+    for n in names.tolist():
+        h.update(str(n).encode("utf-8"))
+        h.update(b"\0")
+    h.update(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def _atomic_write(path: str, write) -> None:
+    """write(tmp_path) next to `path`, then atomically move it into place."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _write_json(path: str, obj: dict) -> None:
+    with open(path, "w") as f:
+        json.dump(obj, f)
+
+
+class ExactIndex:
+    """Brute-force inner product; the reference for recall measurements."""
+    name = "exact"
+
+    def __init__(self):
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def build(self, matrix: np.ndarray, digest: str) -> None:
+        self.matrix = matrix
+
+    def add(self, rows: np.ndarray, matrix: np.ndarray, digest: str) -> None:
+        self.matrix = matrix
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sims = queries @ self.matrix.T
+        k = min(k, sims.shape[1])
+        ids = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(sims, ids, axis=1)
+        order = np.argsort(-top, axis=1)
+        return np.take_along_axis(ids, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def __len__(self) -> int:
+        return int(self.matrix.shape[0])
+
+
+class HnswIndex:
+    """HNSW graph over normalised embeddings (inner product == cosine)."""
+    name = "hnsw"
+
+    def __init__(self, path: str = _INDEX_PATH):
+        if hnswlib is None:
+            raise ImportError("hnswlib is not installed (pip install hnswlib)")
+        self.path = path
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def _meta_path(self) -> str:
+        return self.path + ".json"
+
+    def _new_index(self, dim: int, capacity: int):
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.init_index(max_elements=max(capacity, 1024), ef_construction=_HNSW_EF_CONSTRUCTION, M=_HNSW_M)
+        index.set_ef(_HNSW_EF_SEARCH)
+        return index
+
+    def _try_load(self, dim: int, count: int, digest: str) -> bool:
+        try:
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if not isinstance(meta, dict) or meta.get("digest") != digest or meta.get("count") != count or meta.get("dim") != dim:
+            return False
+
+        # a truncated/corrupt or mismatched file is just a cache miss: rebuild
+        try:
+            index = hnswlib.Index(space="ip", dim=dim)
+            index.load_index(self.path, max_elements=max(count * 2, 1024))
+            if index.get_current_count() != count:
+                raise ValueError(f"holds {index.get_current_count()} rows, expected {count}")
+        except Exception as e:
+            print(f"[ann] WARNING ignoring unreadable index {self.path} ({e}); rebuilding")
+            return False
+        index.set_ef(_HNSW_EF_SEARCH)
+        self._index = index
+        print(f"[ann] Loaded HNSW index ({count} rows) from {self.path}")
+        return True
+
+    def _save(self, dim: int, count: int, digest: str) -> None:
+        # temp file + os.replace for both: a crash or a concurrent save never
+        # leaves a half-written index behind
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            _atomic_write(self.path, self._index.save_index)
+            _atomic_write(self._meta_path, lambda tmp: _write_json(tmp, {"digest": digest, "count": count, "dim": dim}))
+        except (OSError, RuntimeError) as e:
+            print(f"[ann] WARNING could not persist index to {self.path}: {e}")
+
+    def build(self, matrix: np.ndarray, digest: str) -> None:
+        count, dim = matrix.shape if matrix.ndim == 2 else (0, 0)
+        with self._lock:
+            if count == 0:
+                self._index = None
+                return
+            if self._try_load(dim, count, digest):
+                return
+
+            index = self._new_index(dim, count * 2)
+            index.add_items(matrix, np.arange(count))
+            self._index = index
+            self._save(dim, count, digest)
+            print(f"[ann] Built HNSW index over {count} rows")
+
+    def add(self, rows: np.ndarray, matrix: np.ndarray, digest: str) -> None:
+        """Incremental insert; `rows` are the last len(rows) rows of `matrix`."""
+        count, dim = matrix.shape
+        with self._lock:
+            if self._index is None:
+                self._index = self._new_index(dim, count * 2)
+                rows, start = matrix, 0
+            else:
+                start = self._index.get_current_count()
+            if count > self._index.get_max_elements():
+                self._index.resize_index(count * 2)
+            self._index.add_items(rows, np.arange(start, start + len(rows)))
+            self._save(dim, count, digest)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if self._index is None:
+                n = queries.shape[0]
+                return np.zeros((n, 0), dtype=np.int64), np.zeros((n, 0), dtype=np.float32)
+            k = min(k, self._index.get_current_count())
+            ids, dists = self._index.knn_query(queries, k=k)
+        return ids.astype(np.int64), (1.0 - dists).astype(np.float32)
+
+    def __len__(self) -> int:
+        return 0 if self._index is None else int(self._index.get_current_count())
+
+
+_BACKENDS = {
+    "exact": ExactIndex,
+    "hnsw": HnswIndex,
+}
+
+
+def make_index(backend: Optional[str] = None):
+    """Instantiate the configured search backend, falling back to exact search."""
+    backend = (backend or _SEARCH_BACKEND).lower()
+    if backend not in _BACKENDS:
+        print(f"[ann] WARNING unknown FACE_SEARCH_BACKEND={backend!r}; using exact")
+        backend = "exact"
+    try:
+        return _BACKENDS[backend]()
+    except ImportError as e:
+        print(f"[ann] WARNING {e}; using exact search")
+        return ExactIndex()
+
+
+def measure_recall(index, matrix: np.ndarray, k: int = 1, sample: int = 200, noise: float = 0.05, seed: int = 0) -> dict:
+    """
+    Recall@k of `index` against exact search, using perturbed gallery rows as
+    queries (a stored face seen again under slightly different conditions).
+    """
+    if matrix.shape[0] == 0:
+        return {"backend": index.name, "k": k, "queries": 0, "recall": None}
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(matrix.shape[0], size=min(sample, matrix.shape[0]), replace=False)
+    queries = matrix[picks] + rng.normal(scale=noise, size=(len(picks), matrix.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-8
+
+    exact = ExactIndex()
+    exact.build(matrix, "")
+    exact_ids, _ = exact.search(queries, k)
+    approx_ids, _ = index.search(queries, k)
+
+    hits = sum(len(set(a.tolist()) & set(e.tolist())) for a, e in zip(approx_ids, exact_ids))
+    return {
+        "backend": index.name,
+        "k": int(exact_ids.shape[1]),
+        "queries": int(len(picks)),
+        "recall": hits / float(exact_ids.size) if exact_ids.size else None,
+    }
@@ -11,8 +11,10 @@ class DuplicateName(Exception):
     pass
 
 
-def get_mongo_client(uri: Optional[str] = None) -> MongoClient:
+def get_mongo_client(uri: Optional[str] = None, server_selection_timeout_ms: Optional[int] = None) -> MongoClient:
     mongo_uri = uri or os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+    if server_selection_timeout_ms is not None:
+        return MongoClient(mongo_uri, serverSelectionTimeoutMS=server_selection_timeout_ms)
     client = MongoClient(mongo_uri)
     return client
 
@@ -77,3 +79,12 @@ def find_person_by_name(
         client = get_mongo_client()
     persons = get_persons_collection(client)
     return persons.find_one({"name": name})
+
+
+def get_persons_fingerprint(persons: Collection) -> tuple:
+    """
+    Cheap change marker for the persons collection: (count, newest updated_at).
+    Used by the in-memory face gallery to notice writes from other workers.
+    """
+    newest = persons.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    return persons.count_documents({}), (newest or {}).get("updated_at")
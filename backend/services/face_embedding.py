@@ -1,13 +1,14 @@
 # backend/services/face_embedding.py
 from __future__ import annotations
+import json
 import numpy as np
 import os
 import traceback
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, NamedTuple
 import torch
 from PIL import Image
 from facenet_pytorch import MTCNN
-from .mobile_facenet import MobileFaceNet
+from .mobile_facenet import MobileFaceNet, optimize_mobilefacenet
 
 
 # =========================
@@ -19,15 +20,29 @@ _MOBILEFACENET_PATH = os.environ.get(
     "MOBILEFACENET_PATH",
     os.path.join(_ASSETS_DIR, "model_mobilefacenet.pth"),
 )
+# "fp32" (eager checkpoint), "fused" (BN folded, channels-last TorchScript,
+# cached next to the checkpoint) or "int8" (built by quantize_models.py)
+_MOBILEFACENET_VARIANT = os.environ.get("MOBILEFACENET_VARIANT", "fp32").lower()
+_MOBILEFACENET_INT8_PATH = os.environ.get(
+    "MOBILEFACENET_INT8_PATH",
+    os.path.splitext(_MOBILEFACENET_PATH)[0] + ".int8.pt",
+)
+_MOBILEFACENET_FUSED_PATH = os.environ.get(
+    "MOBILEFACENET_FUSED_PATH",
+    os.path.splitext(_MOBILEFACENET_PATH)[0] + ".fused.pt",
+)
+# max |eager - fused| per embedding component before the fused model is rejected
+_FUSED_ATOL = float(os.environ.get("MOBILEFACENET_FUSED_ATOL", "1e-4"))
 
 _DEVICE = "cpu"  # keep CPU for now; switch to "mps"/"cuda" later if needed
+_INPUT_SIZE = 112  # MobileFaceNet input resolution
 
 
 # =========================
 # Lazy singletons
 # =========================
 _mtcnn: Optional[MTCNN] = None
-_model: Optional[MobileFaceNet] = None
+_model: Optional[torch.nn.Module] = None
 
 
 def _get_mtcnn() -> MTCNN:
@@ -80,18 +95,88 @@ def _load_state_dict_safely(model: torch.nn.Module, ckpt: Any) -> None:
         print("[face] WARNING unexpected keys:", unexpected[:20])
 
 
-def _get_model() -> MobileFaceNet:
-    global _model
-    if _model is None:
-        if not os.path.exists(_MOBILEFACENET_PATH):
-            raise FileNotFoundError(f"MobileFaceNet checkpoint not found: {_MOBILEFACENET_PATH}")
+def check_fused_model(eager: torch.nn.Module, fused: torch.nn.Module, n: int = 16, seed: int = 0) -> Dict[str, Any]:
+    """Compare fused vs eager embeddings on random inputs in the model's [-1, 1] range."""
+    gen = torch.Generator().manual_seed(seed)
+    x = torch.rand(n, 3, _INPUT_SIZE, _INPUT_SIZE, generator=gen) * 2 - 1
+    with torch.inference_mode():
+        ref = eager(x).numpy()
+        out = fused(x.contiguous(memory_format=torch.channels_last)).numpy()
+    max_abs = float(np.abs(ref - out).max())
+    return {
+        "max_abs_diff": max_abs,
+        "min_cosine": float(np.sum(ref * out, axis=1).min()),
+        "atol": _FUSED_ATOL,
+        "ok": max_abs <= _FUSED_ATOL,
+    }
+
+
+def _fused_meta() -> Dict[str, Any]:
+    return {"source_mtime": os.path.getmtime(_MOBILEFACENET_PATH), "torch": torch.__version__}
+
 
-        _model = MobileFaceNet(embedding_dim=128).to(_DEVICE).eval()
+def _load_fused_model(eager: torch.nn.Module) -> torch.nn.Module:
+    """Cached fused TorchScript model, rebuilt (and re-verified) when stale."""
+    meta = _fused_meta()
+    try:
+        with open(_MOBILEFACENET_FUSED_PATH + ".json") as f:
+            if json.load(f) == meta:
+                model = torch.jit.load(_MOBILEFACENET_FUSED_PATH, map_location=_DEVICE).eval()
+                print(f"[face] MobileFaceNet fused loaded from {_MOBILEFACENET_FUSED_PATH}")
+                return model
+    except (FileNotFoundError, ValueError, RuntimeError):
+        pass
+
+    import copy
+    fused = optimize_mobilefacenet(copy.deepcopy(eager), _INPUT_SIZE)
+    report = check_fused_model(eager, fused)
+    if not report["ok"]:
+        print(f"[face] WARNING fused MobileFaceNet differs from eager ({report}); using fp32")
+        return eager
+
+    try:
+        torch.jit.save(fused, _MOBILEFACENET_FUSED_PATH)
+        with open(_MOBILEFACENET_FUSED_PATH + ".json", "w") as f:
+            json.dump(meta, f)
+    except OSError as e:
+        print(f"[face] WARNING could not cache fused model to {_MOBILEFACENET_FUSED_PATH}: {e}")
+    print(f"[face] MobileFaceNet fused + verified (max_abs_diff={report['max_abs_diff']:.2e})")
+    return fused
+
+
+def load_mobilefacenet(variant: str = "fp32") -> torch.nn.Module:
+    """
+    Eval-mode MobileFaceNet. variant="fused" folds BN and serves a cached
+    channels-last TorchScript module; variant="int8" loads the quantised
+    model. Both fall back to fp32 if unavailable.
+    """
+    if variant == "int8":
+        if os.path.exists(_MOBILEFACENET_INT8_PATH):
+            model = torch.jit.load(_MOBILEFACENET_INT8_PATH, map_location=_DEVICE).eval()
+            print(f"[face] MobileFaceNet INT8 loaded from {_MOBILEFACENET_INT8_PATH}")
+            return model
+        print(f"[face] WARNING {_MOBILEFACENET_INT8_PATH} not found (run quantize_models.py); using fp32")
+    elif variant not in ("fp32", "fused"):
+        print(f"[face] WARNING unknown MOBILEFACENET_VARIANT={variant!r}; using fp32")
 
-        ckpt = torch.load(_MOBILEFACENET_PATH, map_location=_DEVICE)
-        _load_state_dict_safely(_model, ckpt)
+    if not os.path.exists(_MOBILEFACENET_PATH):
+        raise FileNotFoundError(f"MobileFaceNet checkpoint not found: {_MOBILEFACENET_PATH}")
 
-        print(f"[face] MobileFaceNet loaded from {_MOBILEFACENET_PATH}")
+    model = MobileFaceNet(embedding_dim=128).to(_DEVICE).eval()
+
+    ckpt = torch.load(_MOBILEFACENET_PATH, map_location=_DEVICE)
+    _load_state_dict_safely(model, ckpt)
+
+    print(f"[face] MobileFaceNet loaded from {_MOBILEFACENET_PATH}")
+    if variant == "fused":
+        return _load_fused_model(model)
+    return model
+
+
+def _get_model() -> torch.nn.Module:
+    global _model
+    if _model is None:
+        _model = load_mobilefacenet(_MOBILEFACENET_VARIANT)
     return _model
 
 
@@ -143,28 +228,133 @@ def detect_face_and_crop(bgr_image: np.ndarray) -> List[Dict[str, Any]]:
         return []
 
 
+def _preprocess_crops(crops_bgr: List[np.ndarray]) -> torch.Tensor:
+    """
+    Stack BGR face crops into one normalized (N, 3, 112, 112) RGB batch.
+    Each crop gets the same PIL resize enrolment used, so embeddings stay
+    comparable with existing galleries; scaling and layout are then handled
+    once for the whole batch.
+    """
+    batch = np.empty((len(crops_bgr), _INPUT_SIZE, _INPUT_SIZE, 3), dtype=np.uint8)
+    for i, crop in enumerate(crops_bgr):
+        # BGR -> RGB PIL -> 112x112
+        batch[i] = np.asarray(Image.fromarray(np.ascontiguousarray(crop[:, :, ::-1])).resize((_INPUT_SIZE, _INPUT_SIZE)))
+
+    # NHWC -> NCHW, [0,255] -> [0,1] -> [-1,1]
+    # (the permuted view keeps NHWC strides, i.e. it is already channels-last)
+    x = torch.from_numpy(batch).permute(0, 3, 1, 2).float()
+    return x.div_(255.0).sub_(0.5).div_(0.5)
+
+
+def generate_embeddings(face_crops_bgr: List[np.ndarray]) -> np.ndarray:
+    """
+    Input: list of face crops (BGR, any size)
+    Output: normalized embeddings (shape: (N, 128)), one forward pass for all crops
+    """
+    if len(face_crops_bgr) == 0:
+        return np.zeros((0, 128), dtype=np.float32)
+
+    model = _get_model()
+    x = _preprocess_crops(face_crops_bgr)
+
+    with torch.inference_mode():
+        embs = model(x.to(_DEVICE)).cpu().numpy()  # (N, 128)
+
+    # Ensure L2-normalized (model already does this)
+    return embs / (np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12)
+
+
 def generate_embedding(face_crop_bgr: np.ndarray) -> np.ndarray:
     """
     Input: face crop (BGR)
     Output: normalized embedding (shape: (128,))
     """
-    model = _get_model()
+    return generate_embeddings([face_crop_bgr])[0]
 
-    # BGR -> RGB PIL -> 112x112
-    rgb = face_crop_bgr[:, :, ::-1]
-    pil = Image.fromarray(rgb).resize((112, 112))
 
-    # to tensor [0,1], then normalize to [-1,1]
-    x = torch.from_numpy(np.array(pil)).float() / 255.0  # HWC
-    x = x.permute(2, 0, 1).unsqueeze(0)  # 1CHW
-    x = (x - 0.5) / 0.5
+class GalleryGroups(NamedTuple):
+    """Row -> person bookkeeping for per-person aggregation over a gallery matrix."""
+    person_names: np.ndarray  # (P,) unique names
+    order: np.ndarray         # (M,) row permutation that makes each person's rows contiguous
+    starts: np.ndarray        # (P,) first position of each person inside `order`
+    counts: np.ndarray        # (P,) embeddings per person
 
-    with torch.no_grad():
-        emb = model(x.to(_DEVICE)).cpu().numpy()[0]  # (128,)
 
-    # Ensure L2-normalized (model already does this)
-    norm = np.linalg.norm(emb) + 1e-12
-    return emb / norm
+_AGGREGATES = ("max", "mean", "centroid")
+
+
+def group_labels(labels: np.ndarray) -> GalleryGroups:
+    """Precompute per-person grouping for a (M,) array of row names."""
+    person_names, person_ids = np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)
+    order = np.argsort(person_ids, kind="stable")
+    counts = np.bincount(person_ids, minlength=len(person_names))
+    starts = (np.cumsum(counts) - counts).astype(np.intp)
+    return GalleryGroups(person_names, order, starts, counts)
+
+
+def normalize_embeddings(embs: np.ndarray) -> np.ndarray:
+    """(N, D) -> row-wise L2-normalised float32 (C-contiguous)."""
+    embs = np.atleast_2d(np.asarray(embs, dtype=np.float32))
+    return np.ascontiguousarray(embs / (np.linalg.norm(embs, axis=1, keepdims=True) + 1e-8))
+
+
+def match_embeddings(
+    queries: np.ndarray,
+    gallery: np.ndarray,
+    labels: np.ndarray,
+    top_k: int = 1,
+    aggregate: str = "max",
+    groups: Optional[GalleryGroups] = None,
+) -> List[List[Tuple[str, float]]]:
+    """
+    Batched matcher: one (N, D) x (D, M) matrix multiply for every face in a frame.
+
+    queries: (N, D) embeddings (normalised here)
+    gallery: (M, D) pre-normalised embeddings
+    labels:  (M,) person name per gallery row
+    aggregate: how rows of the same person are combined:
+        "max"      best single embedding (same as the old per-embedding loop)
+        "mean"     mean cosine over the person's embeddings
+        "centroid" cosine to the person's normalised mean embedding
+    Returns for every query a list of up to top_k (name, similarity), best first.
+    """
+    if aggregate not in _AGGREGATES:
+        raise ValueError(f"aggregate must be one of {_AGGREGATES}, got {aggregate!r}")
+
+    queries = normalize_embeddings(queries)
+    n = queries.shape[0]
+    if n == 0 or gallery.shape[0] == 0:
+        return [[] for _ in range(n)]
+
+    if aggregate == "max" and top_k == 1:
+        # fast path: no grouping needed
+        sims = queries @ gallery.T
+        best = np.argmax(sims, axis=1)
+        best_sims = sims[np.arange(n), best]
+        return [[(str(labels[b]), float(s))] for b, s in zip(best, best_sims)]
+
+    if groups is None:
+        groups = group_labels(labels)
+
+    if aggregate == "centroid":
+        centroids = np.add.reduceat(gallery[groups.order], groups.starts, axis=0)
+        scores = queries @ normalize_embeddings(centroids).T
+    else:
+        sims = (queries @ gallery.T)[:, groups.order]
+        if aggregate == "max":
+            scores = np.maximum.reduceat(sims, groups.starts, axis=1)
+        else:
+            scores = np.add.reduceat(sims, groups.starts, axis=1) / groups.counts
+
+    k = min(top_k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    ranked = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+
+    return [
+        [(str(groups.person_names[j]), float(scores[q, j])) for j in ranked[q]]
+        for q in range(n)
+    ]
 
 
 def compare_embedding_to_db(
@@ -176,32 +366,31 @@ def compare_embedding_to_db(
     Returns (best_name, best_similarity) if best_similarity >= threshold else None.
     Assumes db_persons items look like: {"name": "...", "embeddings": [[...],[...],...]}
     """
-
-    # ensure 1D float32
-    emb = np.asarray(emb, dtype=np.float32).reshape(-1)
-
-    # normalize (even if already normalized)
-    emb_norm = np.linalg.norm(emb) + 1e-8
-    emb = emb / emb_norm
-
-    best_name = None
-    best_sim = -1.0
-
+    rows, labels = [], []
     for person in db_persons:
         name = person.get("name", "unknown")
-        embs_list = person.get("embeddings", [])
+        for e in person.get("embeddings", []):
+            rows.append(e)
+            labels.append(name)
 
-        for e in embs_list:
-            e = np.asarray(e, dtype=np.float32).reshape(-1)
-            e = e / (np.linalg.norm(e) + 1e-8)
+    if not rows:
+        return None
 
-            sim = float(np.dot(emb, e))  # cosine since both normalized
-            if sim > best_sim:
-                best_sim = sim
-                best_name = name
+    gallery = normalize_embeddings(np.asarray(rows, dtype=np.float32))
+    best_name, best_sim = match_embeddings(emb, gallery, np.asarray(labels, dtype=object))[0][0]
 
     print(f"[match] best candidate: {best_name}, best cosine: {best_sim:.4f}, threshold: {threshold}")
 
-    if best_sim >= threshold and best_name is not None:
+    if best_sim >= threshold:
         return best_name, best_sim
     return None
+
+
+if __name__ == "__main__":
+    # Bundled check: python -m services.face_embedding
+    _eager = load_mobilefacenet("fp32")
+    _fused = load_mobilefacenet("fused")
+    _report = check_fused_model(_eager, _fused)
+    _report["fused_active"] = isinstance(_fused, torch.jit.ScriptModule)
+    print(json.dumps(_report, indent=2))
+    raise SystemExit(0 if _report["ok"] and _report["fused_active"] else 1)
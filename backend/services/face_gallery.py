@@ -0,0 +1,220 @@
+# backend/services/face_gallery.py
+"""
+Process-resident face gallery.
+
+Loads every enrolled embedding from the `persons` collection once into a single
+contiguous float32 matrix (rows L2-normalised) with a matching name array, so the
+per-frame recognition path never talks to MongoDB.
+
+The gallery is kept in sync by:
+- add_person(): called right after save_person_profile() in this process
+- a background watcher: MongoDB change stream when available (replica set),
+  otherwise a cheap fingerprint poll (count + newest updated_at) every
+  FACE_GALLERY_REFRESH_SEC seconds, to pick up writes from other workers.
+
+Nearest-neighbour lookups go through face_ann (exact or HNSW, see
+FACE_SEARCH_BACKEND).
+"""
+from __future__ import annotations
+import os
+import threading
+import traceback
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from . import face_ann, face_database
+from .face_embedding import GalleryGroups, group_labels, match_embeddings, normalize_embeddings
+
+
+_REFRESH_SEC = float(os.environ.get("FACE_GALLERY_REFRESH_SEC", "10"))
+# Fail fast when Mongo is down (pymongo's default is 30 s); the watcher keeps retrying
+_MONGO_TIMEOUT_MS = int(os.environ.get("FACE_GALLERY_MONGO_TIMEOUT_MS", "2000"))
+# Per-face "[match]" log lines (hot per-frame path; off by default)
+_DEBUG_MATCHES = os.environ.get("FACE_MATCH_DEBUG", "0") == "1"
+# How multiple embeddings of one person are combined: max | mean | centroid
+_AGGREGATE = os.environ.get("FACE_MATCH_AGGREGATE", "max")
+
+
+class FaceGallery:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._client = None
+        self._fingerprint = None
+
+        # Replaced wholesale on every change; readers grab a reference via snapshot()
+        self.matrix = np.zeros((0, 0), dtype=np.float32)  # (M, D), rows L2-normalised
+        self.names = np.zeros((0,), dtype=object)          # (M,) person name per row
+        self.groups: GalleryGroups = group_labels(self.names)
+        self.index = face_ann.make_index()
+
+    # =========================
+    # Read side (per-frame path)
+    # =========================
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, GalleryGroups, object]:
+        """(matrix, names, groups, index) as one consistent set."""
+        with self._lock:
+            return self.matrix, self.names, self.groups, self.index
+
+    @property
+    def num_embeddings(self) -> int:
+        return int(self.matrix.shape[0])
+
+    @property
+    def num_persons(self) -> int:
+        return len(self.groups.person_names)
+
+    def match(self, emb: np.ndarray, threshold: float = 0.6) -> Optional[Tuple[str, float]]:
+        """
+        Returns (best_name, best_similarity) if best_similarity >= threshold else None.
+        Same contract as face_embedding.compare_embedding_to_db, without the DB list.
+        """
+        return self.match_many(np.asarray(emb).reshape(1, -1), threshold=threshold)[0]
+
+    def match_many(
+        self,
+        embs: np.ndarray,
+        threshold: float = 0.6,
+        aggregate: Optional[str] = None,
+    ) -> List[Optional[Tuple[str, float]]]:
+        """Match every face of a frame in one matrix multiply; None where below threshold."""
+        embs = np.asarray(embs, dtype=np.float32)
+        matrix, names, groups, index = self.snapshot()
+        if embs.shape[0] == 0 or matrix.shape[0] == 0:
+            return [None] * embs.shape[0]
+
+        if index.name == "exact":
+            results = match_embeddings(embs, matrix, names, top_k=1, aggregate=aggregate or _AGGREGATE, groups=groups)
+        else:
+            # ANN returns the nearest stored embedding, i.e. "max" aggregation
+            ids, sims = index.search(normalize_embeddings(embs), k=1)
+            results = [
+                [(str(names[i[0]]), float(s[0]))] if len(i) and i[0] < len(names) else []
+                for i, s in zip(ids, sims)
+            ]
+
+        matches: List[Optional[Tuple[str, float]]] = []
+        for top in results:
+            if not top:
+                matches.append(None)
+                continue
+            best_name, best_sim = top[0]
+            if _DEBUG_MATCHES:
+                print(f"[match] best candidate: {best_name}, best cosine: {best_sim:.4f}, threshold: {threshold}")
+            matches.append((best_name, best_sim) if best_sim >= threshold else None)
+        return matches
+
+    def recall(self, k: int = 1, sample: int = 200) -> dict:
+        """Recall@k of the configured search backend against exact search."""
+        matrix, _, _, index = self.snapshot()
+        return face_ann.measure_recall(index, matrix, k=k, sample=sample)
+
+    # =========================
+    # Write side
+    # =========================
+    def _get_client(self):
+        if self._client is None:
+            self._client = face_database.get_mongo_client(server_selection_timeout_ms=_MONGO_TIMEOUT_MS)
+        return self._client
+
+    def load(self) -> None:
+        """(Re)build the matrix from the persons collection."""
+        persons = face_database.get_persons_collection(self._get_client())
+        fingerprint = face_database.get_persons_fingerprint(persons)
+
+        rows: List[List[float]] = []
+        names: List[str] = []
+        for person in persons.find({}, {"name": 1, "embeddings": 1}):
+            name = person.get("name", "unknown")
+            for e in person.get("embeddings", []):
+                rows.append(e)
+                names.append(name)
+
+        matrix = normalize_embeddings(np.asarray(rows, dtype=np.float32)) if rows else np.zeros((0, 0), dtype=np.float32)
+        name_arr = np.asarray(names, dtype=object)
+        groups = group_labels(name_arr)
+        # a fresh index, swapped in with the arrays so readers never pair new ids with old names
+        index = face_ann.make_index()
+        index.build(matrix, face_ann.gallery_digest(name_arr, matrix))
+
+        with self._lock:
+            self.matrix, self.names, self.groups, self.index = matrix, name_arr, groups, index
+            self._fingerprint = fingerprint
+
+        print(f"[gallery] Loaded {self.num_persons} persons / {self.num_embeddings} embeddings")
+
+    def add_person(self, name: str, embeddings: List[List[float]]) -> None:
+        """Append a freshly registered person without reloading the collection."""
+        if not embeddings:
+            return
+        new_rows = normalize_embeddings(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            if self.matrix.shape[0] == 0:
+                matrix = new_rows
+            else:
+                matrix = np.concatenate([self.matrix, new_rows], axis=0)
+            self.matrix = np.ascontiguousarray(matrix)
+            self.names = np.concatenate([self.names, np.asarray([name] * len(new_rows), dtype=object)])
+            self.groups = group_labels(self.names)
+            self.index.add(new_rows, self.matrix, face_ann.gallery_digest(self.names, self.matrix))
+            # Force the poller to re-check; our own insert changes the fingerprint
+            self._fingerprint = None
+
+        print(f"[gallery] Added '{name}' ({len(new_rows)} embeddings)")
+
+    # =========================
+    # Cross-worker sync
+    # =========================
+    def start(self) -> None:
+        try:
+            self.load()
+        except Exception:
+            # Mongo may be down at startup; the watcher keeps retrying
+            traceback.print_exc()
+
+        if self._watcher is None:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="face-gallery-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _watch(self) -> None:
+        try:
+            persons = face_database.get_persons_collection(self._get_client())
+            with persons.watch(full_document="updateLookup") as stream:
+                print("[gallery] Watching persons collection (change stream)")
+                while not self._stop.is_set():
+                    if stream.try_next() is not None:
+                        self.load()
+                    else:
+                        self._stop.wait(0.5)
+            return
+        except Exception as e:
+            # Standalone mongod has no change streams
+            print(f"[gallery] Change stream unavailable ({e}); polling every {_REFRESH_SEC}s")
+
+        while not self._stop.wait(_REFRESH_SEC):
+            try:
+                persons = face_database.get_persons_collection(self._get_client())
+                if face_database.get_persons_fingerprint(persons) != self._fingerprint:
+                    self.load()
+            except Exception:
+                traceback.print_exc()
+
+
+# =========================
+# Lazy singleton
+# =========================
+_gallery: Optional[FaceGallery] = None
+
+
+def get_gallery() -> FaceGallery:
+    global _gallery
+    if _gallery is None:
+        _gallery = FaceGallery()
+    return _gallery
@@ -0,0 +1,175 @@
+# backend/services/inference_pool.py
+"""
+Bounded worker pool for blocking inference (YOLO, MTCNN, TFLite, KMeans, pymongo).
+
+Endpoints `await get_pool().run("<model>", fn, *args)` instead of calling fn on
+the event loop, so one slow frame no longer stalls every other client.
+
+- INFERENCE_WORKERS: executor threads (default: min(8, cpu count))
+- INFERENCE_MAX_QUEUE: jobs allowed in flight (queued + running) before new
+  ones are rejected with PoolSaturated -> HTTP 503 + Retry-After
+- INFERENCE_LIMITS: per-model concurrency, e.g. "objects=1,face=2,db=4"
+  (models that are not thread-safe stay at 1)
+- INFERENCE_RETRY_AFTER: seconds suggested to rejected clients
+"""
+from __future__ import annotations
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from . import micro_batcher, tflite_pool
+
+
+_WORKERS = int(os.environ.get("INFERENCE_WORKERS", str(min(8, os.cpu_count() or 1))))
+_MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", "32"))
+_RETRY_AFTER = int(os.environ.get("INFERENCE_RETRY_AFTER", "1"))
+
+_DEFAULT_LIMITS = {
+    "decode": _WORKERS,
+    "encode": _WORKERS,  # annotated previews
+    # ultralytics predictors are not thread-safe; with micro-batching the
+    # batcher thread serialises model calls, so let a full batch queue up
+    "objects": micro_batcher.MAX_BATCH if micro_batcher.batching_enabled() else 1,
+    "clothes": 1,
+    "currency": tflite_pool.POOL_SIZE,  # one request per pooled tf.lite.Interpreter
+    "face": 2,
+    "color": 2,
+    "db": 4,
+}
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = dict(_DEFAULT_LIMITS)
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            print(f"[pool] WARNING ignoring bad INFERENCE_LIMITS entry: {item!r}")
+    return limits
+
+
+class PoolSaturated(Exception):
+    """Raised when the pool already holds INFERENCE_MAX_QUEUE jobs."""
+    def __init__(self, model: str, retry_after: int = _RETRY_AFTER):
+        super().__init__(f"Inference pool saturated (model={model})")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class _ModelStats:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    def as_dict(self) -> dict:
+        done = max(self.completed, 1)
+        return {
+            "limit": self.limit,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_ms_avg": round(self.wait_total / done * 1000, 2),
+            "wait_ms_max": round(self.wait_max * 1000, 2),
+            "run_ms_avg": round(self.run_total / done * 1000, 2),
+        }
+
+
+class InferencePool:
+    def __init__(self, workers: int = _WORKERS, max_queue: int = _MAX_QUEUE, limits: Optional[Dict[str, int]] = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.limits = limits if limits is not None else _parse_limits(os.environ.get("INFERENCE_LIMITS", ""))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, _ModelStats] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _stats_for(self, model: str) -> _ModelStats:
+        if model not in self._stats:
+            self._stats[model] = _ModelStats(self.limits.get(model, 1))
+        return self._stats[model]
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(self.limits.get(model, 1))
+        return self._semaphores[model]
+
+    def _call(self, model: str, submitted: float, fn: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        wait = started - submitted
+        with self._lock:
+            stats = self._stats_for(model)
+            stats.queued -= 1
+            stats.running += 1
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                stats.running -= 1
+                stats.completed += 1
+                stats.run_total += time.perf_counter() - started
+
+    async def run(self, model: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool under `model`'s concurrency limit."""
+        with self._lock:
+            stats = self._stats_for(model)
+            if self._pending >= self.max_queue:
+                stats.rejected += 1
+                raise PoolSaturated(model)
+            self._pending += 1
+            stats.queued += 1
+
+        submitted = time.perf_counter()
+        started = False
+        try:
+            async with self._semaphore(model):
+                loop = asyncio.get_running_loop()
+                call = functools.partial(self._call, model, submitted, functools.partial(fn, *args, **kwargs))
+                started = True
+                return await loop.run_in_executor(self._executor, call)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if not started:
+                    # cancelled while waiting for the model slot
+                    stats.queued -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "models": {name: s.as_dict() for name, s in self._stats.items()},
+            }
+
+
+# =========================
+# Lazy singleton
+# =========================
+_pool: Optional[InferencePool] = None
+
+
+def get_pool() -> InferencePool:
+    global _pool
+    if _pool is None:
+        _pool = InferencePool()
+        print(f"[pool] {_pool.workers} workers, max_queue={_pool.max_queue}, limits={_pool.limits}")
+    return _pool
@@ -0,0 +1,140 @@
+# backend/services/micro_batcher.py
+"""
+Dynamic micro-batching for models shared by many concurrent requests.
+
+Requests call `batcher.submit(image, conf)` from inference-pool threads and
+block (or `enqueue()` into several batchers first, then `.wait()` on each); a single worker thread per model collects everything that arrives within
+YOLO_BATCH_WINDOW_MS of the first queued frame (up to YOLO_MAX_BATCH), runs one
+batched predict, and hands each caller its own result.
+
+The batch is predicted at the lowest requested confidence; callers filter their
+own boxes by their own threshold.
+
+YOLO_BATCH_WINDOW_MS=0 (default) disables batching.
+"""
+from __future__ import annotations
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+WINDOW_MS = float(os.environ.get("YOLO_BATCH_WINDOW_MS", "0"))
+MAX_BATCH = int(os.environ.get("YOLO_MAX_BATCH", "8"))
+
+_DELAY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def batching_enabled() -> bool:
+    return WINDOW_MS > 0 and MAX_BATCH > 1
+
+
+class _Request:
+    __slots__ = ("item", "conf", "enqueued", "done", "result", "error")
+
+    def __init__(self, item: Any, conf: float):
+        self.item = item
+        self.conf = conf
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+    def wait(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        name: str,
+        predict_fn: Callable[[List[Any], float], List[Any]],
+        max_batch: int = MAX_BATCH,
+        window_ms: float = WINDOW_MS,
+    ):
+        """predict_fn(items, conf) -> one result per item, in order."""
+        self.name = name
+        self.max_batch = max(1, max_batch)
+        self.window = max(0.0, window_ms) / 1000.0
+        self._predict_fn = predict_fn
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._lock = threading.Lock()
+
+        # histograms
+        self._batch_sizes = [0] * (self.max_batch + 1)
+        self._delay_counts = [0] * (len(_DELAY_BUCKETS_MS) + 1)
+        self._batches = 0
+        self._items = 0
+
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+        _REGISTRY[name] = self
+
+    def enqueue(self, item: Any, conf: float) -> _Request:
+        """Non-blocking: queue the item; `.wait()` on the handle returns its result."""
+        req = _Request(item, conf)
+        self._queue.put(req)
+        return req
+
+    def submit(self, item: Any, conf: float) -> Any:
+        """Blocking: returns this item's result once its batch has run."""
+        return self.enqueue(item, conf).wait()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch: List[_Request]) -> None:
+        started = time.perf_counter()
+        with self._lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._batch_sizes[len(batch)] += 1
+            for req in batch:
+                delay_ms = (started - req.enqueued) * 1000
+                bucket = next((i for i, b in enumerate(_DELAY_BUCKETS_MS) if delay_ms <= b), len(_DELAY_BUCKETS_MS))
+                self._delay_counts[bucket] += 1
+
+        try:
+            results = self._predict_fn([req.item for req in batch], min(req.conf for req in batch))
+            for req, res in zip(batch, results):
+                req.result = res
+        except BaseException as e:
+            for req in batch:
+                req.error = e
+        finally:
+            for req in batch:
+                req.done.set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"<={b}ms" for b in _DELAY_BUCKETS_MS] + [f">{_DELAY_BUCKETS_MS[-1]}ms"]
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": round(self._items / self._batches, 2) if self._batches else None,
+                "queue_depth": self._queue.qsize(),
+                "batch_size_histogram": {str(i): n for i, n in enumerate(self._batch_sizes) if i and n},
+                "queue_delay_histogram": dict(zip(labels, self._delay_counts)),
+            }
+
+
+_REGISTRY: Dict[str, MicroBatcher] = {}
+
+
+def batcher_stats() -> dict:
+    return {name: b.snapshot() for name, b in _REGISTRY.items()}
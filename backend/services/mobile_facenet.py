@@ -1,4 +1,5 @@
 # backend/services/mobilefacenet_model.py
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -73,3 +74,32 @@ class MobileFaceNet(nn.Module):
         x = self.bn_fc(x)
         x = F.normalize(x, p=2, dim=1)
         return x
+
+
+# ---- Inference-time optimisation ----
+def fuse_mobilefacenet(model: MobileFaceNet) -> MobileFaceNet:
+    """
+    Fold every BatchNorm into the preceding Conv/Linear (eval mode, in place):
+    ConvBlock conv+bn, gdc+bn_gdc and fc+bn_fc. PReLU stays separate.
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+
+    model.eval()
+    for m in list(model.modules()):
+        if isinstance(m, ConvBlock) and isinstance(m.bn, nn.BatchNorm2d):
+            m.conv = fuse_conv_bn_eval(m.conv, m.bn)
+            m.bn = nn.Identity()
+    model.gdc = fuse_conv_bn_eval(model.gdc, model.bn_gdc)
+    model.bn_gdc = nn.Identity()
+    model.fc = fuse_linear_bn_eval(model.fc, model.bn_fc)
+    model.bn_fc = nn.Identity()
+    return model
+
+
+def optimize_mobilefacenet(model: MobileFaceNet, input_size: int = 112):
+    """Fused-BN, channels-last, traced and frozen TorchScript module."""
+    model = fuse_mobilefacenet(model).to(memory_format=torch.channels_last)
+    example = torch.zeros(2, 3, input_size, input_size).to(memory_format=torch.channels_last)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    return torch.jit.freeze(traced.eval())
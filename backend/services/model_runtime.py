@@ -0,0 +1,238 @@
+# backend/services/model_runtime.py
+"""
+Runtime selection for the ultralytics YOLO models (object, COCO, clothes).
+
+YOLO_RUNTIME picks how the .pt checkpoints are served on CPU:
+- "torch" (default): PyTorch eager, the reference path
+- "onnx": ONNX Runtime, exported to <name>.onnx next to the .pt
+- "openvino": OpenVINO IR, exported to <name>_openvino_model/ next to the .pt
+
+Exported artifacts are cached with a small .json sidecar (source mtime, imgsz,
+dynamic batch) and re-exported only when the checkpoint or settings change.
+Any export/load failure falls back to the PyTorch model, so a missing
+onnxruntime/openvino install never stops the server.
+
+Each model can also be served as an INT8 variant (<name>.int8.onnx, produced
+by quantize_models.py from calibration frames); main.py selects it per model
+with CUSTOM_MODEL_VARIANT / COCO_MODEL_VARIANT / CLOTHES_MODEL_VARIANT=int8.
+
+Results keep the ultralytics Results API (boxes.xyxy/conf/cls, names), so
+detectors produce the same JSON on every runtime; `compare_results` measures
+how close a runtime's boxes are to the PyTorch ones (see export_models.py).
+"""
+from __future__ import annotations
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from . import micro_batcher
+
+
+YOLO_RUNTIME = os.environ.get("YOLO_RUNTIME", "torch").lower()
+YOLO_IMGSZ = int(os.environ.get("YOLO_IMGSZ", "640"))
+
+# ultralytics export format and the artifact it writes next to <stem>.pt
+_FORMATS = {
+    "onnx": ("onnx", lambda stem: stem + ".onnx"),
+    "openvino": ("openvino", lambda stem: stem + "_openvino_model"),
+}
+
+
+def artifact_path(pt_path: str, runtime: str) -> str:
+    stem, _ = os.path.splitext(pt_path)
+    return _FORMATS[runtime][1](stem)
+
+
+def int8_path(pt_path: str) -> str:
+    """Statically quantised ONNX model written by quantize_models.py."""
+    stem, _ = os.path.splitext(pt_path)
+    return stem + ".int8.onnx"
+
+
+def _export_meta(pt_path: str, imgsz: int, dynamic: bool) -> dict:
+    return {"source_mtime": os.path.getmtime(pt_path), "imgsz": imgsz, "dynamic": dynamic}
+
+
+def _is_fresh(path: str, meta: dict) -> bool:
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path + ".json") as f:
+            return json.load(f) == meta
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def export_yolo(pt_path: str, runtime: str, imgsz: int = YOLO_IMGSZ, dynamic: Optional[bool] = None, force: bool = False) -> str:
+    """Export pt_path for `runtime` unless a fresh cached artifact exists. Returns its path."""
+    if runtime not in _FORMATS:
+        raise ValueError(f"Unknown YOLO runtime: {runtime!r}")
+    if dynamic is None:
+        # micro-batching feeds several frames per call
+        dynamic = micro_batcher.batching_enabled()
+
+    path = artifact_path(pt_path, runtime)
+    meta = _export_meta(pt_path, imgsz, dynamic)
+    if not force and _is_fresh(path, meta):
+        return path
+
+    from ultralytics import YOLO
+    print(f"[runtime] Exporting {os.path.basename(pt_path)} -> {runtime} (imgsz={imgsz}, dynamic={dynamic})")
+    exported = YOLO(pt_path).export(format=_FORMATS[runtime][0], imgsz=imgsz, dynamic=dynamic)
+    path = str(exported or path)
+    with open(path + ".json", "w") as f:
+        json.dump(meta, f)
+    return path
+
+
+def load_yolo(pt_path: str, runtime: Optional[str] = None, imgsz: int = YOLO_IMGSZ, variant: str = "fp32"):
+    """
+    YOLO model for pt_path on the configured runtime, falling back to PyTorch.
+    variant="int8" serves the quantised ONNX model when it has been built.
+    """
+    from ultralytics import YOLO
+
+    if variant.lower() == "int8":
+        path = int8_path(pt_path)
+        if os.path.exists(path):
+            try:
+                model = YOLO(path, task="detect")
+                print(f"[runtime] Serving {os.path.basename(pt_path)} as INT8 ({path})")
+                return model
+            except Exception as e:
+                print(f"[runtime] WARNING could not load {path} ({e})")
+        else:
+            print(f"[runtime] WARNING {path} not found (run quantize_models.py); using fp32")
+    elif variant.lower() != "fp32":
+        print(f"[runtime] WARNING unknown model variant {variant!r}; using fp32")
+
+    runtime = (runtime or YOLO_RUNTIME).lower()
+    if runtime == "torch":
+        return YOLO(pt_path)
+    if runtime not in _FORMATS:
+        print(f"[runtime] WARNING unknown YOLO_RUNTIME={runtime!r}; using torch")
+        return YOLO(pt_path)
+
+    try:
+        path = export_yolo(pt_path, runtime, imgsz=imgsz)
+        model = YOLO(path, task="detect")
+        print(f"[runtime] Serving {os.path.basename(pt_path)} via {runtime} ({path})")
+        return model
+    except Exception as e:
+        print(f"[runtime] WARNING {runtime} unavailable for {pt_path} ({e}); using torch")
+        return YOLO(pt_path)
+
+
+# =========================
+# Accuracy check
+# =========================
+def _boxes(result):
+    b = result.boxes
+    return _np(b.xyxy).reshape(-1, 4), _np(b.conf).reshape(-1), _np(b.cls).reshape(-1).astype(int)
+
+
+def _np(t) -> np.ndarray:
+    return t.cpu().numpy() if hasattr(t, "cpu") else np.asarray(t)
+
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare_results(reference, candidate, iou_threshold: float = 0.5) -> Dict[str, float]:
+    """
+    Greedy same-class IoU matching of candidate boxes against reference boxes,
+    for one image. Returns match counts, mean IoU and worst confidence drift.
+    """
+    ref_xyxy, ref_conf, ref_cls = _boxes(reference)
+    cand_xyxy, cand_conf, cand_cls = _boxes(candidate)
+
+    matched, ious, conf_diffs = 0, [], []
+    if len(ref_xyxy) and len(cand_xyxy):
+        iou = _iou_matrix(ref_xyxy, cand_xyxy)
+        iou[ref_cls[:, None] != cand_cls[None, :]] = 0.0
+        while True:
+            r, c = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[r, c] < iou_threshold:
+                break
+            matched += 1
+            ious.append(float(iou[r, c]))
+            conf_diffs.append(abs(float(ref_conf[r] - cand_conf[c])))
+            iou[r, :] = 0.0
+            iou[:, c] = 0.0
+
+    return {
+        "reference_boxes": int(len(ref_xyxy)),
+        "candidate_boxes": int(len(cand_xyxy)),
+        "matched": matched,
+        "mean_iou": float(np.mean(ious)) if ious else None,
+        "max_conf_diff": max(conf_diffs) if conf_diffs else None,
+    }
+
+
+def summarize(per_image: List[Dict[str, float]]) -> dict:
+    ref = sum(r["reference_boxes"] for r in per_image)
+    cand = sum(r["candidate_boxes"] for r in per_image)
+    matched = sum(r["matched"] for r in per_image)
+    ious = [r["mean_iou"] for r in per_image if r["mean_iou"] is not None]
+    diffs = [r["max_conf_diff"] for r in per_image if r["max_conf_diff"] is not None]
+    return {
+        "images": len(per_image),
+        "recall": matched / ref if ref else None,
+        "precision": matched / cand if cand else None,
+        "mean_iou": float(np.mean(ious)) if ious else None,
+        "max_conf_diff": max(diffs) if diffs else None,
+        "identical_box_sets": all(r["matched"] == r["reference_boxes"] == r["candidate_boxes"] for r in per_image),
+    }
+
+
+def pseudo_map50(references, candidates, iou_threshold: float = 0.5) -> Optional[float]:
+    """
+    mAP@0.5 of candidate detections scored against reference detections used
+    as ground truth (FP32 outputs when measuring quantisation drift).
+    """
+    hits_by_class: Dict[int, list] = {}   # cls -> [(conf, is_tp)]
+    refs_by_class: Dict[int, int] = {}    # cls -> reference box count
+    for reference, candidate in zip(references, candidates):
+        ref_xyxy, _, ref_cls = _boxes(reference)
+        cand_xyxy, cand_conf, cand_cls = _boxes(candidate)
+        for cls in np.unique(np.concatenate([ref_cls, cand_cls])).tolist():
+            r = ref_xyxy[ref_cls == cls]
+            order = np.argsort(-cand_conf[cand_cls == cls])
+            c, conf = cand_xyxy[cand_cls == cls][order], cand_conf[cand_cls == cls][order]
+            refs_by_class[cls] = refs_by_class.get(cls, 0) + len(r)
+            hits = hits_by_class.setdefault(cls, [])
+
+            taken = np.zeros(len(r), dtype=bool)
+            iou = _iou_matrix(c, r) if len(c) and len(r) else None
+            for i in range(len(c)):
+                tp = False
+                if iou is not None:
+                    free = np.where(taken, 0.0, iou[i])
+                    j = int(np.argmax(free))
+                    if free[j] >= iou_threshold:
+                        taken[j] = tp = True
+                hits.append((float(conf[i]), tp))
+
+    aps = []
+    for cls, hits in hits_by_class.items():
+        n_ref = refs_by_class[cls]
+        if n_ref == 0:
+            continue
+        hits.sort(key=lambda h: -h[0])
+        tp = np.cumsum([h[1] for h in hits]) if hits else np.zeros(0)
+        recall = tp / n_ref
+        precision = tp / np.arange(1, len(hits) + 1)
+        # all-point interpolated AP
+        mrec = np.concatenate([[0.0], recall, [1.0]])
+        mpre = np.concatenate([[1.0], precision, [0.0]])
+        mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+        aps.append(float(np.sum((mrec[1:] - mrec[:-1]) * mpre[1:])))
+    return float(np.mean(aps)) if aps else None
@@ -0,0 +1,70 @@
+# backend/services/tflite_pool.py
+"""
+Pool of TFLite interpreters for one model.
+
+A tf.lite.Interpreter is not safe under concurrent set_tensor/invoke, so each
+request checks one out for the duration of its inference:
+
+    with pool.checkout() as interpreter:
+        ...
+
+- TFLITE_THREADS: intra-op threads per interpreter (default 2)
+- TFLITE_INTERPRETERS: interpreters per model (default: cpu count // threads)
+
+The inference pool uses POOL_SIZE as the "currency" concurrency limit, so
+checkouts never wait on an executor thread.
+"""
+from __future__ import annotations
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, List
+
+
+INTERPRETER_THREADS = max(1, int(os.environ.get("TFLITE_THREADS", "2")))
+POOL_SIZE = max(1, int(os.environ.get("TFLITE_INTERPRETERS", "0")) or (os.cpu_count() or 1) // INTERPRETER_THREADS)
+
+
+class InterpreterPool:
+    def __init__(self, factory: Callable[[int], Any], size: int = POOL_SIZE, num_threads: int = INTERPRETER_THREADS):
+        """factory(num_threads) -> a new Interpreter; tensors are allocated here."""
+        self.size = size
+        self.num_threads = num_threads
+        self.interpreters: List[Any] = []
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._waits = 0
+
+        for _ in range(size):
+            interpreter = factory(num_threads)
+            interpreter.allocate_tensors()
+            self.interpreters.append(interpreter)
+            self._idle.put(interpreter)
+
+    @contextmanager
+    def checkout(self):
+        """Borrow an interpreter exclusively; blocks while all are busy."""
+        try:
+            interpreter = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._waits += 1
+            interpreter = self._idle.get()
+        with self._lock:
+            self._checkouts += 1
+        try:
+            yield interpreter
+        finally:
+            self._idle.put(interpreter)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "threads_per_interpreter": self.num_threads,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "waited": self._waits,
+            }
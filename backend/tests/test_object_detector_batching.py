@@ -0,0 +1,60 @@
+import functools
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+import object_detection
+from services.micro_batcher import MicroBatcher
+
+
+class FakeModel:
+    """Records the batch size of every call; one empty result per image."""
+
+    names = {0: "thing"}
+
+    def __init__(self):
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def __call__(self, images, conf=0.25):
+        images = images if isinstance(images, list) else [images]
+        with self._lock:
+            self.batch_sizes.append(len(images))
+        time.sleep(0.01)
+        return [object() for _ in images]
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    models = {"custom.pt": FakeModel(), "coco.pt": FakeModel()}
+    monkeypatch.setattr(object_detection, "load_yolo", lambda path, variant="fp32": models[path])
+    monkeypatch.setattr(object_detection, "batching_enabled", lambda: True)
+    monkeypatch.setattr(object_detection, "OBJECT_DETECTOR_PARALLEL", True)
+    monkeypatch.setattr(object_detection, "MicroBatcher", functools.partial(MicroBatcher, max_batch=8, window_ms=100))
+    return object_detection.ObjectDetector(custom_model_path="custom.pt", coco_model_path="coco.pt")
+
+
+def test_concurrent_requests_share_one_batch(detector):
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    start = threading.Barrier(8)
+    results = []
+
+    def request():
+        start.wait()
+        results.append(detector._predict_both(image, 0.25))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert len(results) == 8
+    assert all(len(custom) == 1 and len(coco) == 1 for custom, coco in results)
+    assert detector.custom_model.batch_sizes == [8]
+    assert detector.coco_model.batch_sizes == [8]